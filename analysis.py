@@ -1,18 +1,168 @@
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 from transformers import pipeline
 from textstat import textstat  # Library for readability metrics
+from metrics import REGISTRY, increment, timed
+
+# Metrics reported in "overall_statistics", in output order
+METRICS = (
+    "sentiment",
+    "emotion",
+    "flesch_reading_ease",
+    "flesch_kincaid_grade",
+    "gunning_fog",
+    "smog_index",
+    "lexical_diversity"
+)
+
+def metric_values(result):
+    """
+    Flatten one per-comment result into a {metric: value} dictionary.
+    """
+    values = {
+        "sentiment": result["sentiment"]["sentiment_score"],
+        "emotion": result["emotion"]["emotion_score"]
+    }
+    values.update(result["writing_level"])
+    return values
+
+def lexical_diversity(text):
+    """
+    Calculate lexical diversity (unique words / total words).
+    """
+    words = text.split()
+    if len(words) == 0:
+        return 0
+    return len(set(words)) / len(words)
+
+def writing_level(comment):
+    """
+    Readability metrics of a single comment.
+    A module-level function so it can be sent to a process pool.
+    """
+    return {
+        "flesch_reading_ease": textstat.flesch_reading_ease(comment),  # Higher score = easier to read
+        "flesch_kincaid_grade": textstat.flesch_kincaid_grade(comment),  # U.S. school grade level
+        "gunning_fog": textstat.gunning_fog(comment),  # Years of education needed to understand
+        "smog_index": textstat.smog_index(comment),  # Years of education needed to understand
+        "lexical_diversity": lexical_diversity(comment)  # Unique words / total words
+    }
+
+def timed_writing_level(comment):
+    """
+    writing_level plus the seconds it took. Pool workers (possibly other
+    processes) cannot record into this process's REGISTRY, so the caller does.
+    """
+    start = time.perf_counter()
+    level = writing_level(comment)
+    return level, time.perf_counter() - start
+
+class RunningStatistics:
+    """
+    Mean, median and standard deviation of a stream of values in constant memory.
+
+    Mean and (population) standard deviation are exact, using Welford's
+    algorithm. The median is exact for up to EXACT_MEDIAN_LIMIT values. Past
+    that it is estimated with the P-squared algorithm (Jain & Chlamtac, 1985),
+    which tracks five markers seeded from the buffered values instead of
+    storing every value.
+    """
+    EXACT_MEDIAN_LIMIT = 1024
 
-class SentimentAnalyzer:
     def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.buffer = []
+        # P-squared marker heights, actual positions and desired positions
+        self.heights = None
+        self.positions = None
+        self.desired = None
+        self.increments = [0, 0.25, 0.5, 0.75, 1]
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        if self.heights is None:
+            self.buffer.append(value)
+            if len(self.buffer) > self.EXACT_MEDIAN_LIMIT:
+                self._start_markers()
+        else:
+            self._update_markers(value)
+
+    def _start_markers(self):
+        """
+        Seed the five P-squared markers (min, quartiles, max) from the buffer and drop it.
+        """
+        values = sorted(self.buffer)
+        last = len(values) - 1
+        self.desired = [0, last / 4, last / 2, 3 * last / 4, last]
+        self.positions = [round(position) for position in self.desired]
+        self.heights = [values[position] for position in self.positions]
+        self.buffer = []
+
+    def _update_markers(self, value):
+        q = self.heights
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if q[i] <= value < q[i + 1])
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # Piecewise-parabolic prediction, falling back to linear if it breaks monotonicity
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def result(self):
+        """
+        Return the statistics in the same form as SentimentAnalyzer._calculate_statistics.
+        """
+        if self.count == 0:
+            return {"mean": float("nan"), "median": float("nan"), "std": float("nan")}
+        median = self.heights[2] if self.heights is not None else float(np.median(self.buffer))
+        return {
+            "mean": self.mean,
+            "median": median,
+            "std": (self.m2 / self.count) ** 0.5
+        }
+
+class SentimentAnalyzer:
+    def __init__(self, sentiment_pipeline=None, emotion_pipeline=None):
         """
         Initialize the sentiment, emotion, and writing level analysis models.
+        Either pipeline can be passed in (e.g. a stub for benchmarks) instead of being loaded.
         """
         # Load pre-trained sentiment analysis model
-        self.sentiment_pipeline = pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+        self.sentiment_pipeline = sentiment_pipeline or pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
 
         # Load pre-trained emotion detection model
-        self.emotion_pipeline = pipeline("text-classification", model="bhadresh-savani/distilbert-base-uncased-emotion")
+        self.emotion_pipeline = emotion_pipeline or pipeline("text-classification", model="bhadresh-savani/distilbert-base-uncased-emotion")
 
+    @timed("analysis.sentiment")
     def _analyze_sentiment(self, comment):
         """
         Analyze the sentiment of a single comment.
@@ -23,6 +173,7 @@ class SentimentAnalyzer:
             "sentiment_score": result["score"]
         }
 
+    @timed("analysis.emotion")
     def _analyze_emotion(self, comment):
         """
         Analyze the emotion of a single comment.
@@ -33,26 +184,18 @@ class SentimentAnalyzer:
             "emotion_score": result["score"]
         }
 
+    @timed("analysis.writing_level")
     def _analyze_writing_level(self, comment):
         """
         Analyze the writing level of a single comment using readability metrics.
         """
-        return {
-            "flesch_reading_ease": textstat.flesch_reading_ease(comment),  # Higher score = easier to read
-            "flesch_kincaid_grade": textstat.flesch_kincaid_grade(comment),  # U.S. school grade level
-            "gunning_fog": textstat.gunning_fog(comment),  # Years of education needed to understand
-            "smog_index": textstat.smog_index(comment),  # Years of education needed to understand
-            "lexical_diversity": self._calculate_lexical_diversity(comment)  # Unique words / total words
-        }
+        return writing_level(comment)
 
     def _calculate_lexical_diversity(self, text):
         """
         Calculate lexical diversity (unique words / total words).
         """
-        words = text.split()
-        if len(words) == 0:
-            return 0
-        return len(set(words)) / len(words)
+        return lexical_diversity(text)
 
     def _calculate_statistics(self, scores):
         """
@@ -64,60 +207,171 @@ class SentimentAnalyzer:
             "std": np.std(scores)
         }
 
-    def __call__(self, comments):
+    def analyze_comment(self, comment):
         """
-        Process a list of comments and return:
-        1. Individual scores for each metric.
-        2. Overall average scores and statistical features.
+        Run every analysis on a single comment and return the combined result.
         """
-        results = []
-        sentiment_scores = []
-        emotion_scores = []
-        flesch_reading_ease_scores = []
-        flesch_kincaid_grade_scores = []
-        gunning_fog_scores = []
-        smog_index_scores = []
-        lexical_diversity_scores = []
+        result = {
+            "comment": comment,
+            "sentiment": self._analyze_sentiment(comment),
+            "emotion": self._analyze_emotion(comment),
+            "writing_level": self._analyze_writing_level(comment)
+        }
+        increment("analysis.comments")
+        return result
 
-        for comment in comments:
-            # Analyze sentiment
-            sentiment_result = self._analyze_sentiment(comment)
-            sentiment_scores.append(sentiment_result["sentiment_score"])
-
-            # Analyze emotion
-            emotion_result = self._analyze_emotion(comment)
-            emotion_scores.append(emotion_result["emotion_score"])
-
-            # Analyze writing level
-            writing_level_result = self._analyze_writing_level(comment)
-            flesch_reading_ease_scores.append(writing_level_result["flesch_reading_ease"])
-            flesch_kincaid_grade_scores.append(writing_level_result["flesch_kincaid_grade"])
-            gunning_fog_scores.append(writing_level_result["gunning_fog"])
-            smog_index_scores.append(writing_level_result["smog_index"])
-            lexical_diversity_scores.append(writing_level_result["lexical_diversity"])
-
-            # Combine results for this comment
+    def _classify_batch(self, comments):
+        """
+        Run both model pipelines over a list of comments as one forward pass each.
+        Without batch_size a pipeline still runs one forward pass per list element,
+        and without truncation one over-long comment would fail the whole batch.
+        """
+        options = {"batch_size": len(comments), "truncation": True}
+        return self.sentiment_pipeline(comments, **options), self.emotion_pipeline(comments, **options)
+
+    @timed("analysis.batch")
+    def analyze_batch(self, comments):
+        """
+        Analyze several comments, passing them to each model pipeline as one batch.
+        Returns the same per-comment results as analyze_comment, in input order.
+        """
+        comments = list(comments)
+        sentiments, emotions = self._classify_batch(comments)
+        results = []
+        for comment, sentiment, emotion in zip(comments, sentiments, emotions):
             results.append({
                 "comment": comment,
-                "sentiment": sentiment_result,
-                "emotion": emotion_result,
-                "writing_level": writing_level_result
+                "sentiment": {"sentiment_label": sentiment["label"], "sentiment_score": sentiment["score"]},
+                "emotion": {"emotion_label": emotion["label"], "emotion_score": emotion["score"]},
+                "writing_level": self._analyze_writing_level(comment)
             })
+        increment("analysis.comments", len(results))
+        return results
 
-        # Calculate overall statistics
-        overall_stats = {
-            "sentiment": self._calculate_statistics(sentiment_scores),
-            "emotion": self._calculate_statistics(emotion_scores),
-            "flesch_reading_ease": self._calculate_statistics(flesch_reading_ease_scores),
-            "flesch_kincaid_grade": self._calculate_statistics(flesch_kincaid_grade_scores),
-            "gunning_fog": self._calculate_statistics(gunning_fog_scores),
-            "smog_index": self._calculate_statistics(smog_index_scores),
-            "lexical_diversity": self._calculate_statistics(lexical_diversity_scores)
-        }
+    @timed("analysis.concurrent")
+    def analyze_concurrent(self, comments, executor="thread", workers=None, batch_size=32):
+        """
+        Analyze comments with the readability metrics running in a worker pool
+        while the model pipelines run batches on the calling thread.
+
+        torch releases the GIL during a forward pass, so even a thread pool
+        overlaps textstat with inference. A process pool also spreads textstat
+        over several cores, at the cost of pickling every comment.
+        Returns the same per-comment results as analyze_batch, in input order.
+
+        :param executor: "thread", "process", or an existing concurrent.futures
+            Executor to reuse across calls (it is not shut down).
+        :param workers: Pool size for a new pool (default: CPU count).
+        :param batch_size: Comments per model pipeline call.
+        """
+        comments = list(comments)
+        if isinstance(executor, Executor):
+            pool, owned = executor, False
+        elif executor == "thread":
+            pool, owned = ThreadPoolExecutor(workers), True
+        elif executor == "process":
+            pool, owned = ProcessPoolExecutor(workers), True
+        else:
+            raise ValueError(f"Unknown executor {executor!r}, expected 'thread', 'process' or an Executor")
+
+        try:
+            # map submits every chunk up front, so the pool works through them during inference
+            chunksize = max(1, len(comments) // ((workers or os.cpu_count() or 1) * 4))
+            levels = pool.map(timed_writing_level, comments, chunksize=chunksize)
+            sentiments = []
+            emotions = []
+            for start in range(0, len(comments), batch_size):
+                batch_sentiments, batch_emotions = self._classify_batch(comments[start:start + batch_size])
+                sentiments.extend(batch_sentiments)
+                emotions.extend(batch_emotions)
+            results = []
+            for comment, sentiment, emotion, (level, seconds) in zip(comments, sentiments, emotions, levels):
+                REGISTRY.observe("analysis.writing_level", seconds)
+                results.append({
+                    "comment": comment,
+                    "sentiment": {"sentiment_label": sentiment["label"], "sentiment_score": sentiment["score"]},
+                    "emotion": {"emotion_label": emotion["label"], "emotion_score": emotion["score"]},
+                    "writing_level": level
+                })
+        finally:
+            if owned:
+                pool.shutdown()
+        increment("analysis.comments", len(results))
+        return results
+
+    def summarize(self, results):
+        """
+        Calculate the overall statistics for a list of per-comment results.
+        """
+        scores = {metric: [] for metric in METRICS}
+        for result in results:
+            for metric, value in metric_values(result).items():
+                scores[metric].append(value)
+        return {metric: self._calculate_statistics(scores[metric]) for metric in METRICS}
+
+    def analyze_iter(self, comments, running=None, batch_size=None):
+        """
+        Lazily analyze any iterable of comments, yielding one result per comment.
+
+        If `running` (from new_running_statistics) is given, it is updated with
+        each result before the result is yielded. Only the current comment
+        (or batch, when batch_size is set) is held in memory.
+        """
+        if batch_size:
+            batch = []
+            for comment in comments:
+                batch.append(comment)
+                if len(batch) == batch_size:
+                    yield from self._yield_results(self.analyze_batch(batch), running)
+                    batch = []
+            if batch:
+                yield from self._yield_results(self.analyze_batch(batch), running)
+            return
+
+        for comment in comments:
+            yield from self._yield_results([self.analyze_comment(comment)], running)
+
+    def _yield_results(self, results, running):
+        for result in results:
+            if running is not None:
+                for metric, value in metric_values(result).items():
+                    running[metric].update(value)
+            yield result
+
+    def new_running_statistics(self):
+        """
+        Create one RunningStatistics per metric, for use with analyze_iter.
+        """
+        return {metric: RunningStatistics() for metric in METRICS}
+
+    def analyze_statistics(self, comments, batch_size=None):
+        """
+        Stats-only mode: return just the overall statistics of an iterable of
+        comments, discarding each per-comment result as soon as it is counted.
+        Memory stays constant however many comments there are; the median is
+        the streaming estimate described in RunningStatistics.
+        """
+        running = self.new_running_statistics()
+        for _ in self.analyze_iter(comments, running, batch_size):
+            pass
+        return {metric: running[metric].result() for metric in METRICS}
+
+    def __call__(self, comments, concurrent=False, executor="thread", workers=None):
+        """
+        Process a list of comments and return:
+        1. Individual scores for each metric.
+        2. Overall average scores and statistical features.
+        With concurrent=True the comments go through analyze_concurrent, which
+        overlaps the readability metrics with model inference; the results are the same.
+        """
+        if concurrent:
+            results = self.analyze_concurrent(comments, executor, workers)
+        else:
+            results = [self.analyze_comment(comment) for comment in comments]
 
         return {
             "individual_results": results,
-            "overall_statistics": overall_stats
+            "overall_statistics": self.summarize(results)
         }
 
 
@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")  # Plots are only written to disk
+
+import synthetic_corpus
+
+# A stage regresses when its median time grows by more than this fraction
+DEFAULT_THRESHOLD = 0.2
+# Largest allowed peak-memory ratio between 10x and 1x the comments in analyze_iter_memory
+MAX_PEAK_GROWTH = 1.5
+
+def time_case(func, repeat=5):
+    """
+    Run func `repeat` times and return the timings in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def summarize(timings, items=None):
+    """
+    Summarize timings as min/median/max seconds and, if `items` is given, items per second.
+    """
+    result = {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+        "repeat": len(timings)
+    }
+    if items:
+        result["items"] = items
+        result["items_per_second"] = items / result["median"]
+    return result
+
+def bench_extract_comments(size, repeat):
+    from get_comments_from_urls import do_comments_page
+    thread = synthetic_corpus.generate_thread(num_comments=size, seed=1)
+    count = len(do_comments_page(thread))
+    return summarize(time_case(lambda: do_comments_page(thread), repeat), count)
+
+def bench_normalize(size, repeat):
+    from normalize import normalize_comment
+    comments = synthetic_corpus.generate_markdown_comments(size, seed=1)
+    megabytes = sum(len(comment.encode("utf-8")) for comment in comments) / 1e6
+    result = summarize(time_case(lambda: [normalize_comment(comment) for comment in comments], repeat), size)
+    result["mb_per_second"] = megabytes / result["median"]
+    return result
+
+def _stub_analyzer():
+    from analysis import SentimentAnalyzer
+    return SentimentAnalyzer(
+        sentiment_pipeline=synthetic_corpus.stub_sentiment_pipeline(),
+        emotion_pipeline=synthetic_corpus.stub_emotion_pipeline()
+    )
+
+def bench_analyzer_call(size, repeat):
+    analyzer = _stub_analyzer()
+    comments = synthetic_corpus.generate_comments(size, seed=2)
+    return summarize(time_case(lambda: analyzer(comments), repeat), size)
+
+def bench_concurrent_readability(size, repeat):
+    """
+    Wall-clock of analyze_batch over batches of BATCH_SIZE comments (serial
+    readability) and of analyze_concurrent with the same batch size, on the
+    same corpus, so the speedup is the overlap alone and not batching. The stub
+    models sleep about as long per comment as textstat takes, standing in for
+    forward passes that release the GIL.
+    """
+    from analysis import SentimentAnalyzer
+    batch_size = 32
+    comments = synthetic_corpus.generate_comments(size, seed=2)
+    analyzer = SentimentAnalyzer(
+        sentiment_pipeline=synthetic_corpus.stub_sentiment_pipeline(latency=0.0002),
+        emotion_pipeline=synthetic_corpus.stub_emotion_pipeline(latency=0.0002)
+    )
+
+    def serial():
+        for start in range(0, len(comments), batch_size):
+            analyzer.analyze_batch(comments[start:start + batch_size])
+
+    serial_result = summarize(time_case(serial, repeat), size)
+    result = summarize(time_case(lambda: analyzer.analyze_concurrent(comments, batch_size=batch_size), repeat), size)
+    result["serial_median"] = serial_result["median"]
+    result["speedup"] = serial_result["median"] / result["median"]
+    print(f"  serial {serial_result['median'] * 1000:.2f} ms, speedup {result['speedup']:.2f}x")
+    return result
+
+def bench_writing_level(size, repeat):
+    analyzer = _stub_analyzer()
+    comments = synthetic_corpus.generate_comments(size, seed=3)
+
+    def run():
+        for comment in comments:
+            analyzer._analyze_writing_level(comment)
+
+    return summarize(time_case(run, repeat), size)
+
+def bench_analyze_iter_memory(size, repeat):
+    """
+    Time the stats-only analyze_statistics path and check with tracemalloc that
+    its peak memory does not grow with the number of comments. The size is kept
+    above RunningStatistics.EXACT_MEDIAN_LIMIT, below which values are buffered,
+    so --scale cannot turn the check into a false failure.
+    """
+    from analysis import RunningStatistics
+    size = max(size, RunningStatistics.EXACT_MEDIAN_LIMIT + 1)
+    analyzer = _stub_analyzer()
+
+    def comment_stream(count):
+        rng = random.Random(7)
+        return (synthetic_corpus.generate_comment_text(rng) for _ in range(count))
+
+    def peak_bytes(count):
+        tracemalloc.start()
+        analyzer.analyze_statistics(comment_stream(count))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    result = summarize(time_case(lambda: analyzer.analyze_statistics(comment_stream(size)), repeat), size)
+    small, large = peak_bytes(size), peak_bytes(size * 10)
+    result["peak_bytes"] = {str(size): small, str(size * 10): large}
+    result["peak_growth"] = large / small
+    result["memory_ok"] = result["peak_growth"] <= MAX_PEAK_GROWTH
+    if not result["memory_ok"]:
+        print(f"  FAIL: peak memory grew {result['peak_growth']:.2f}x for 10x the comments")
+    return result
+
+def bench_merge_json(size, repeat):
+    from merge_json import merge_json_files
+    with tempfile.TemporaryDirectory() as directory:
+        input_folder = os.path.join(directory, "input")
+        os.makedirs(input_folder)
+        num_files = max(1, size // 50)
+        for i in range(num_files):
+            with open(os.path.join(input_folder, f"{i}.json"), "w") as file:
+                json.dump(synthetic_corpus.generate_posts(10, seed=i), file)
+        output_file = os.path.join(directory, "merged.json")
+        return summarize(time_case(lambda: merge_json_files(input_folder, output_file), repeat), num_files)
+
+def bench_calculate_statistics(size, repeat):
+    from post_analysis import calculate_statistics
+    data = synthetic_corpus.generate_post_statistics(size, seed=4)
+    return summarize(time_case(lambda: calculate_statistics(data), repeat), size)
+
+def bench_compare_plotting(size, repeat):
+    import compare
+    with tempfile.TemporaryDirectory() as directory:
+        file1 = os.path.join(directory, "a.json")
+        file2 = os.path.join(directory, "b.json")
+        with open(file1, "w") as file:
+            json.dump(synthetic_corpus.generate_post_statistics(size, seed=5), file)
+        with open(file2, "w") as file:
+            json.dump(synthetic_corpus.generate_post_statistics(size, seed=6, shift=1.0), file)
+        # Times one full compare.py run over every plot type
+        return summarize(time_case(lambda: compare.main(file1, file2, "A", "B", directory), repeat))
+
+# name -> (function, default size)
+CASES = {
+    "extract_comments": (bench_extract_comments, 5000),
+    "normalize": (bench_normalize, 20000),
+    "analyzer_call": (bench_analyzer_call, 500),
+    "concurrent_readability": (bench_concurrent_readability, 500),
+    "writing_level": (bench_writing_level, 1000),
+    "analyze_iter_memory": (bench_analyze_iter_memory, 1500),
+    "merge_json": (bench_merge_json, 2000),
+    "calculate_statistics": (bench_calculate_statistics, 2000),
+    "compare_plotting": (bench_compare_plotting, 200)
+}
+
+def run_benchmarks(names=None, repeat=5, scale=1.0):
+    """
+    Run the selected benchmark cases and return a JSON-serialisable result.
+    """
+    names = names or list(CASES)
+    results = {}
+    for name in names:
+        func, size = CASES[name]
+        case_repeat = 1 if name == "compare_plotting" else repeat
+        print(f"Running {name}...")
+        results[name] = func(max(1, int(size * scale)), case_repeat)
+        print(f"  median {results[name]['median'] * 1000:.2f} ms")
+
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "scale": scale
+        },
+        "results": results
+    }
+
+def memory_failures(results):
+    """
+    Names of the cases whose memory check failed, independent of any baseline.
+    """
+    return [name for name, result in results["results"].items() if result.get("memory_ok") is False]
+
+def compare_runs(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two benchmark results and return the cases whose median slowed
+    down by more than `threshold` (as a fraction of the baseline).
+    """
+    regressions = {}
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median"]
+        after = result["median"]
+        change = (after - before) / before
+        print(f"{name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms ({change:+.1%})")
+        if change > threshold:
+            regressions[name] = {"baseline": before, "current": after, "change": change}
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic Reddit data.")
+    parser.add_argument("cases", nargs="*", help=f"Cases to run (default: all of {', '.join(CASES)}).")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results JSON.")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown fraction before a case is flagged.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every case's input size.")
+    args = parser.parse_args()
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    results = run_benchmarks(args.cases, args.repeat, args.scale)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+    print(f"Results saved to {args.output}")
+
+    failed = memory_failures(results)
+    if failed:
+        print(f"Memory checks failed: {', '.join(failed)}")
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_runs(baseline, results, args.threshold)
+        if regressions:
+            print(f"Regressions past {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
+
+if __name__ == "__main__":
+    main()
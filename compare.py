@@ -5,6 +5,7 @@ import os
 import seaborn as sns
 from scipy.stats import pearsonr
 from collections import *
+from concurrent.futures import ProcessPoolExecutor
 
 def load_json(file_path):
     """Load JSON data from a file."""
@@ -60,6 +61,106 @@ def compare_statistics(file1, file2):
 
     return comparison_results
 
+def per_post_matrix(data):
+    """
+    Collect per-post values into a (metrics x posts) matrix.
+    Returns the matrix and the list of (stat_category, stat_name) row labels.
+    Posts without statistics are skipped.
+    """
+    entries = [entry for entry in data if entry.get('statistics')]
+    labels = [(stat_category, stat_name)
+              for stat_category, values in entries[0]['statistics'].items()
+              for stat_name in values]
+    matrix = np.array([[entry['statistics'][stat_category][stat_name] for entry in entries]
+                       for stat_category, stat_name in labels], dtype=float)
+    return matrix, labels
+
+def _resample_chunk(args):
+    """
+    Run one chunk of permutations and bootstrap resamples for every metric at once.
+
+    Group sums are computed as matrix products with 0/1 (permutation) or count
+    (bootstrap) weight matrices, so a chunk is a handful of BLAS calls.
+    Returns how often each metric's permuted |difference| reached the observed
+    one, and the bootstrap differences of means (metrics x chunk).
+    """
+    values1, values2, observed, size, seed = args
+    rng = np.random.default_rng(seed)
+    n1, n2 = values1.shape[1], values2.shape[1]
+    pooled = np.concatenate([values1, values2], axis=1)
+
+    # Permutation test: a random n1-subset of the pooled posts plays group 1
+    order = rng.random((size, n1 + n2)).argsort(axis=1)
+    mask = np.zeros((size, n1 + n2))
+    np.put_along_axis(mask, order[:, :n1], 1.0, axis=1)
+    sums1 = pooled @ mask.T
+    permuted = sums1 / n1 - (pooled.sum(axis=1, keepdims=True) - sums1) / n2
+    exceed = (np.abs(permuted) >= np.abs(observed)[:, None] - 1e-12).sum(axis=1)
+
+    # Bootstrap: resample each group with replacement via multinomial counts
+    weights1 = rng.multinomial(n1, np.full(n1, 1 / n1), size=size)
+    weights2 = rng.multinomial(n2, np.full(n2, 1 / n2), size=size)
+    bootstrap = values1 @ weights1.T / n1 - values2 @ weights2.T / n2
+    return exceed, bootstrap
+
+def significance_tests(file1, file2, resamples=10000, confidence=0.95, seed=0, processes=1, chunk_size=500):
+    """
+    Permutation tests and bootstrap CIs for the difference in mean (file1 - file2)
+    of every per-post statistic.
+
+    All metrics are resampled together in batched NumPy operations. Resamples
+    are split into chunks with their own seeds (spawned from `seed`), so the
+    results are the same whatever the number of processes.
+    """
+    values1, labels = per_post_matrix(load_json(file1))
+    values2, labels2 = per_post_matrix(load_json(file2))
+    if labels != labels2:
+        raise ValueError("The two JSON files have different structures.")
+
+    observed = values1.mean(axis=1) - values2.mean(axis=1)
+    sizes = [min(chunk_size, resamples - start) for start in range(0, resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [(values1, values2, observed, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            outputs = list(executor.map(_resample_chunk, chunks))
+    else:
+        outputs = [_resample_chunk(chunk) for chunk in chunks]
+
+    exceed = sum(output[0] for output in outputs)
+    bootstrap = np.concatenate([output[1] for output in outputs], axis=1)
+    alpha = (1 - confidence) / 2
+    lower = np.quantile(bootstrap, alpha, axis=1)
+    upper = np.quantile(bootstrap, 1 - alpha, axis=1)
+    p_values = (exceed + 1) / (resamples + 1)
+
+    results = defaultdict(dict)
+    for i, (stat_category, stat_name) in enumerate(labels):
+        results[stat_category][stat_name] = {
+            'difference': float(observed[i]),
+            'p_value': float(p_values[i]),
+            'ci_low': float(lower[i]),
+            'ci_high': float(upper[i]),
+            'n1': values1.shape[1],
+            'n2': values2.shape[1]
+        }
+    return {
+        'resamples': resamples,
+        'confidence': confidence,
+        'seed': seed,
+        'results': dict(results)
+    }
+
+def print_significance(significance, dataset1_label, dataset2_label):
+    """Print the significance test results as a table."""
+    print(f"Difference in means ({dataset1_label} - {dataset2_label}), "
+          f"{significance['resamples']} resamples, {significance['confidence']:.0%} bootstrap CI:")
+    for stat_category, stats in significance['results'].items():
+        for stat_name, values in stats.items():
+            print(f"  {stat_category}.{stat_name}: {values['difference']:+.4f} "
+                  f"[{values['ci_low']:+.4f}, {values['ci_high']:+.4f}] p={values['p_value']:.4f}")
+
 def get_statistic_description(stat_name):
     """Return a description for the given statistic."""
     descriptions = {
@@ -328,8 +429,11 @@ def plot_histogram(comparison_results, dataset1_label, dataset2_label, output_di
 
             print(f"Saved plot: {plot_filename}")
 
-def main(file1, file2, dataset1_label, dataset2_label, output_dir="comparison_plots"):
-    """Main function to compare two JSON files and generate plots."""
+def main(file1, file2, dataset1_label, dataset2_label, output_dir="comparison_plots", significance_output=None, processes=1):
+    """
+    Main function to compare two JSON files and generate plots.
+    If significance_output is given, significance tests are also run and saved there.
+    """
     comparison_results = compare_statistics(file1, file2)
 
     # Generate all types of plots
@@ -341,10 +445,18 @@ def main(file1, file2, dataset1_label, dataset2_label, output_dir="comparison_pl
 
     print(f"All comparison plots saved to '{output_dir}'.")
 
+    if significance_output:
+        significance = significance_tests(file1, file2, processes=processes)
+        print_significance(significance, dataset1_label, dataset2_label)
+        with open(significance_output, 'w') as file:
+            json.dump(significance, file, indent=4)
+        print(f"Significance results saved to '{significance_output}'.")
+
 if __name__ == "__main__":
     file1 = 'data/CK/CK_Stats.json'  # Replace with your first JSON file path
     file2 = 'data/NZ/NZ_with_stats.json'  # Replace with your second JSON file path
     dataset1_label = "CK"  # Custom label for the first dataset
     dataset2_label = "NZ"  # Custom label for the second dataset
     output_dir = "comparison_plots"  # Directory to save comparison plots
-    main(file1, file2, dataset1_label, dataset2_label, output_dir)
\ No newline at end of file
+    significance_output = "significance_results.json"  # Permutation tests and bootstrap CIs
+    main(file1, file2, dataset1_label, dataset2_label, output_dir, significance_output, processes=os.cpu_count())
\ No newline at end of file
@@ -0,0 +1,336 @@
+import heapq
+import json
+import os
+import signal
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from get_comments_from_urls import build_result, do_request, write_comments_to_json
+from get_outgoing_links import RateLimiter, fetch_listing_page, load_post_store, make_session, save_to_pkl
+from http_cache import ResponseCache
+from metrics import increment, write_jsonl
+
+# Listings are fetched before comment pages so new posts get queued early
+LISTING_PRIORITY = 0
+COMMENTS_PRIORITY = 10
+
+class SystemClock:
+    """
+    Wall-clock time. Sleeps wake up early when `stop_event` is set.
+    """
+    def __init__(self):
+        self.stop_event = threading.Event()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.stop_event.wait(seconds)
+
+class FakeClock:
+    """
+    Manually advanced clock for tests; sleeping just moves time forward.
+    """
+    def __init__(self, start=0.0):
+        self.now = start
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.slept.append(seconds)
+            self.now += seconds
+
+class CrawlScheduler:
+    """
+    Long-running crawler that replaces the fixed `sleep 600` loop in run.sh.
+
+    Work items live in two heaps: `waiting`, ordered by the time they become
+    due, and `ready`, ordered by priority. When Reddit reports that the rate
+    limit is spent, the scheduler sleeps exactly until the reported reset
+    instead of a fixed interval. A rate-limited item is re-queued for the reset
+    without using up one of its `max_attempts`; other failures back off by
+    `retry_delay` seconds per attempt, network errors and malformed responses
+    included. The queue is saved to `state_file` after every item and on
+    shutdown (SIGINT/SIGTERM) or an unexpected error, and reloaded on start.
+
+    `output_directory` is either one directory or a dict mapping each
+    subreddit to its own, so datasets that are compared stay apart.
+
+    Item kinds:
+    - listing: {"subreddit", "time_range", "pages", "interval"}. Fetches the top
+      listing and queues a comments item for every post not yet downloaded.
+      If a page fails, the pages still to fetch and the `after` cursor are kept
+      under "resume" and the retry continues from there. Re-queued `interval`
+      seconds later if an interval is set. Listing pages are served from the
+      cache for at most `listing_ttl` seconds, so re-checks see new posts.
+    - comments: {"id"}. Fetches the comment page of a post in the post store.
+    """
+    def __init__(self, state_file, store_file, output_directory, host='https://old.reddit.com',
+                 cache=None, clock=None, requests_per_minute=60, flush_every=50,
+                 retry_delay=60, max_attempts=5, listing_ttl=600, session=None):
+        self.state_file = state_file
+        self.store_file = store_file
+        self.output_directory = output_directory
+        self.host = host
+        self.cache = cache
+        self.clock = clock or SystemClock()
+        self.limiter = RateLimiter(requests_per_minute, clock=self.clock.time, sleep=self.clock.sleep)
+        self.session = session or make_session()
+        self.flush_every = flush_every
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.listing_ttl = listing_ttl
+
+        self.ready = []
+        self.waiting = []
+        self.seq = 0
+        self.results = []  # (subreddit, result) pairs not yet written
+        self.stopping = False
+        self.store = load_post_store(store_file)
+        self.load_state()
+        self._queue_undownloaded()
+
+    def add(self, kind, payload, priority, due=None):
+        """
+        Queue a work item, to run once `due` (a clock timestamp) has passed.
+        """
+        item = {"kind": kind, "payload": payload, "priority": priority,
+                "due": self.clock.time() if due is None else due, "attempts": 0, "seq": self.seq}
+        self.seq += 1
+        self._push(item)
+
+    def add_listing(self, subreddit, time_range='all', pages=10, interval=None):
+        self.add("listing", {"subreddit": subreddit, "time_range": time_range, "pages": pages, "interval": interval},
+                 LISTING_PRIORITY)
+
+    def _push(self, item):
+        if item["due"] <= self.clock.time():
+            heapq.heappush(self.ready, (item["priority"], item["seq"], item))
+        else:
+            heapq.heappush(self.waiting, (item["due"], item["seq"], item))
+
+    def _promote_due(self):
+        """
+        Move every waiting item whose due time has passed onto the ready heap.
+        """
+        now = self.clock.time()
+        while self.waiting and self.waiting[0][0] <= now:
+            _, _, item = heapq.heappop(self.waiting)
+            heapq.heappush(self.ready, (item["priority"], item["seq"], item))
+
+    def pending(self):
+        return len(self.ready) + len(self.waiting)
+
+    def load_state(self):
+        """
+        Restore the queue saved by a previous run, if any.
+        """
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, 'r') as file:
+            state = json.load(file)
+        self.seq = state["seq"]
+        for item in state["items"]:
+            self._push(item)
+        print(f"Resumed {len(state['items'])} queued items from {self.state_file}")
+
+    def _queued_post_ids(self):
+        return {item["payload"]["id"] for _, _, item in self.ready + self.waiting if item["kind"] == "comments"}
+
+    def _queue_undownloaded(self):
+        """
+        Queue every post in the store that is not downloaded and not already queued,
+        e.g. posts whose comments were fetched but not flushed before a crash.
+        """
+        queued = self._queued_post_ids()
+        for post_id, post in self.store.items():
+            if not post['has_downloaded'] and post_id not in queued:
+                self.add("comments", {"id": post_id}, COMMENTS_PRIORITY)
+
+    def save_state(self):
+        """
+        Atomically write the queue to the state file.
+        """
+        items = [item for _, _, item in self.ready + self.waiting]
+        with open(self.state_file + '.tmp', 'w') as file:
+            json.dump({"seq": self.seq, "items": items}, file)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def _output_for(self, subreddit):
+        if isinstance(self.output_directory, dict):
+            return self.output_directory[subreddit]
+        return self.output_directory
+
+    def flush(self):
+        """
+        Write collected comments to the output directories, then save the post store.
+        The order matters: a post must not be marked downloaded on disk before its
+        comments are.
+        """
+        if self.results:
+            by_directory = {}
+            for subreddit, result in self.results:
+                by_directory.setdefault(self._output_for(subreddit), []).append(result)
+            for directory, results in by_directory.items():
+                write_comments_to_json(results, directory)
+            self.results = []
+        save_to_pkl(list(self.store.values()), self.store_file)
+
+    def stop(self, *args):
+        """
+        Ask the scheduler to finish the current item, save and exit.
+        """
+        print("Shutdown requested, saving queue...")
+        self.stopping = True
+        if isinstance(self.clock, SystemClock):
+            self.clock.stop_event.set()
+
+    def _run_listing(self, payload):
+        base_url = f"{self.host}/r/{payload['subreddit']}/top.json"
+        resume = payload.get('resume') or {}
+        after = resume.get('after')
+        pages_left = resume.get('pages', payload['pages'])
+        queued = self._queued_post_ids()
+        added = failed = False
+
+        while pages_left > 0:
+            status, posts, next_after = fetch_listing_page(self.session, base_url, payload['time_range'], after,
+                                                           self.limiter, self.cache, self.listing_ttl)
+            if status != 200:
+                # Keep the cursor so the retry fetches only the missing pages
+                payload['resume'] = {'after': after, 'pages': pages_left}
+                failed = True
+                break
+            for post in posts:
+                if post['id'] not in self.store:
+                    post['subreddit'] = payload['subreddit']
+                    self.store[post['id']] = post
+                    added = True
+                if not self.store[post['id']]['has_downloaded'] and post['id'] not in queued:
+                    self.add("comments", {"id": post['id']}, COMMENTS_PRIORITY)
+                    queued.add(post['id'])
+            pages_left -= 1
+            after = next_after
+            if not after:
+                break
+
+        if added:
+            # The saved queue refers to these posts, so the store on disk must know them too.
+            # Flushing writes pending comments first, so no post is saved as downloaded too early.
+            self.flush()
+        if failed:
+            return False
+        payload.pop('resume', None)
+        if payload.get('interval'):
+            self.add("listing", payload, LISTING_PRIORITY, due=self.clock.time() + payload['interval'])
+        return True
+
+    def _run_comments(self, payload):
+        post = self.store.get(payload['id'])
+        if post is None or post['has_downloaded']:
+            return True
+        # Keep the path (trailing slash included, as get_comments_from_urls.py requests it,
+        # so both share cache entries) but use our host, so the scheduler can run against a stub server
+        url = self.host + urlsplit(post['URL']).path
+        data = do_request(url, cache=self.cache, limiter=self.limiter, session=self.session)
+        if not data:
+            return False
+        self.results.append((post.get('subreddit'), build_result(post['URL'], data)))
+        post['has_downloaded'] = 1
+        increment("scheduler.posts_downloaded")
+        if len(self.results) >= self.flush_every:
+            self.flush()
+        return True
+
+    def step(self):
+        """
+        Run at most one item, or sleep until the next one can run.
+        Returns False when the queue is empty.
+        """
+        self._promote_due()
+        now = self.clock.time()
+
+        if self.limiter.blocked_until > now:
+            print(f"Rate limited, sleeping {self.limiter.blocked_until - now:.0f}s until reset")
+            self.clock.sleep(self.limiter.blocked_until - now)
+            return True
+        if not self.ready:
+            if not self.waiting:
+                return False
+            self.clock.sleep(self.waiting[0][0] - now)
+            return True
+
+        _, _, item = heapq.heappop(self.ready)
+        blocked_until = self.limiter.blocked_until
+        try:
+            if item["kind"] == "listing":
+                done = self._run_listing(item["payload"])
+            else:
+                done = self._run_comments(item["payload"])
+        except (requests.exceptions.RequestException, ValueError) as error:
+            # Connection errors and bad JSON (ValueError) are ordinary failed attempts
+            increment("scheduler.request_errors")
+            print(f"{item['kind']} {item['payload']} failed: {error}")
+            done = False
+
+        if not done and self.limiter.blocked_until > max(blocked_until, self.clock.time()):
+            # Rate limited: not the item's fault, so retry after the reset without counting an attempt
+            increment("scheduler.rate_limited")
+            item["due"] = self.limiter.blocked_until
+            self._push(item)
+        elif not done:
+            item["attempts"] += 1
+            if item["attempts"] < self.max_attempts:
+                item["due"] = self.clock.time() + self.retry_delay * item["attempts"]
+                self._push(item)
+            else:
+                print(f"Giving up on {item['kind']} {item['payload']} after {item['attempts']} attempts")
+                increment("scheduler.items_dropped")
+
+        self.save_state()
+        return True
+
+    def run(self, install_signal_handlers=True):
+        """
+        Process the queue until it is empty or a shutdown is requested.
+        """
+        if install_signal_handlers:
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        try:
+            while not self.stopping and self.step():
+                pass
+        finally:
+            self.flush()
+            self.save_state()
+            self.session.close()
+        print(f"Scheduler stopped with {self.pending()} items pending.")
+
+if __name__ == "__main__":
+    # One output folder per subreddit, so merge_json.py and the stats scripts see one dataset each
+    output_directories = {'NewZealand': "./data/NZ", 'ConservativeKiwi': "./data/CK"}
+    for directory in output_directories.values():
+        os.makedirs(directory, exist_ok=True)
+
+    scheduler = CrawlScheduler(
+        state_file="./data/scheduler_state.json",
+        store_file="./data/top_posts.pkl",
+        output_directory=output_directories,
+        cache=ResponseCache("./data/cache")
+    )
+    if scheduler.pending() == 0:
+        for subreddit in output_directories:
+            # Re-check the daily listing for new posts every six hours
+            scheduler.add_listing(subreddit, 'all', pages=10)
+            scheduler.add_listing(subreddit, 'day', pages=1, interval=6 * 3600)
+
+    scheduler.run()
+    write_jsonl("metrics.jsonl", run="crawl_scheduler")
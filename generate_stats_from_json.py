@@ -1,8 +1,15 @@
 import json
+import time
 from analysis import SentimentAnalyzer
+from prefilter import drift_from_full, iter_with_prefilter, summarize_reports
+from rollup_cube import RollupCube
+from sampling import adaptive_statistics
+from metrics import REGISTRY, profile_run, timed, to_prometheus, write_jsonl
+from normalize import normalize_item
 
 
 
+@timed("io.load_json")
 def load_json(file_path):
     """
     Load JSON data from a file.
@@ -10,6 +17,7 @@ def load_json(file_path):
     with open(file_path, "r") as file:
         return json.load(file)
 
+@timed("io.save_json")
 def save_json(data, file_path):
     """
     Save JSON data to a file.
@@ -20,26 +28,81 @@ def save_json(data, file_path):
 def process_comments(analyzer, comments):
     """
     Process a list of comments using the SentimentAnalyzer.
+    Only the overall statistics are kept, so the stats-only mode is used.
     """
-    return analyzer(comments)
+    return analyzer.analyze_statistics(comments)
 
-def update_json_with_statistics(json_data, analyzer):
+def has_timestamps(item, cube):
+    """
+    Whether a post can be added to the cube: a cube was given and every comment has a timestamp slot.
+    """
+    return cube is not None and len(item.get("TIMESTAMPS", [])) == len(item.get("COMMENTS", []))
+
+def update_json_with_statistics(json_data, analyzer, prefilter=None, measure_drift=False, sampling=None, cube=None,
+                                default_subreddit=None):
     """
     Update each object in the JSON with sentiment, emotion, and writing level statistics.
+    With a Prefilter, trivial comments are skipped and near-duplicates reuse earlier scores;
+    what was avoided (and, with measure_drift, how far the statistics moved) is recorded
+    under "prefilter". Every path except sampling streams per-comment results into
+    running statistics, so memory does not grow with the size of a post.
+    With `sampling` (keyword arguments for sampling.adaptive_statistics, {} for the defaults)
+    each post is scored on an adaptive sample instead, and the sample size and confidence
+    intervals are recorded under "sampling". The prefilter is not used in this mode.
+    With a RollupCube, the per-comment scores of posts that have TIMESTAMPS are also
+    added to the cube (not in sampling mode, which only scores part of each post).
+    Posts stored before the current NORMALIZER_VERSION are normalized here first;
+    up-to-date posts are not touched again.
     """
+    start = time.perf_counter()
+    already_done = REGISTRY.counters.get("analysis.comments", 0)
     for i,item in enumerate(json_data):
-        print(i)
-        comments = item.get("COMMENTS", [])
-        if comments:
-            # Process the comments
-            results = process_comments(analyzer, comments)
-
-            # Add the overall statistics to the JSON object
+        comments = normalize_item(item).get("COMMENTS", [])
+        if comments and sampling is not None:
+            results = adaptive_statistics(analyzer, comments, depths=item.get("DEPTHS"), **sampling)
             item["statistics"] = results["overall_statistics"]
+            item["sampling"] = results["sampling"]
+        elif comments and prefilter:
+            # Stream the kept comments into running statistics (and the cube) like the plain path
+            running = analyzer.new_running_statistics()
+            report = {}
+            kept = iter_with_prefilter(analyzer, comments, prefilter, report, running)
+            if has_timestamps(item, cube):
+                cube.add_post(item.get("SUBREDDIT") or default_subreddit, item["URL"],
+                              ((item["TIMESTAMPS"][position], result) for position, result in kept))
+            else:
+                for _ in kept:
+                    pass
+            if running["sentiment"].count:
+                item["statistics"] = {metric: stats.result() for metric, stats in running.items()}
+                if measure_drift:
+                    report["drift"] = drift_from_full(analyzer, comments, item["statistics"])
+            item["prefilter"] = report
+        elif comments and has_timestamps(item, cube):
+            # Stream per-comment results into the cube while keeping running statistics
+            running = analyzer.new_running_statistics()
+            cube.add_post(item.get("SUBREDDIT") or default_subreddit, item["URL"],
+                          zip(item["TIMESTAMPS"], analyzer.analyze_iter(comments, running)))
+            item["statistics"] = {metric: stats.result() for metric, stats in running.items()}
+        elif comments:
+            # Process the comments and add the overall statistics to the JSON object
+            item["statistics"] = process_comments(analyzer, comments)
+
+        done = REGISTRY.counters.get("analysis.comments", 0) - already_done
+        print(f"Post {i + 1}/{len(json_data)} ({done / (time.perf_counter() - start):.1f} comments/sec)")
 
     return json_data
 
 def main():
+    # Set REDDIT_PROFILE=<path> to also write a cProfile dump of the run
+    with profile_run():
+        run()
+
+    # Export the stage timings and counters for this run
+    write_jsonl("metrics.jsonl", run="generate_stats_from_json")
+    print(to_prometheus())
+
+def run():
     # Path to the input JSON file
     input_file = "data/NZ/merged_output_NZ.json"
     # Path to the output JSON file
@@ -51,8 +114,25 @@ def main():
     # Initialize the SentimentAnalyzer
     analyzer = SentimentAnalyzer()
 
+    # Set to Prefilter() (from prefilter import Prefilter) to skip trivial comments and reuse
+    # scores for near-duplicates.
+    # It changes the statistics, so check the drift first with measure_drift=True.
+    prefilter = None
+
+    # Set to {} (or e.g. {"method": "bootstrap"}) to score an adaptive sample of each post
+    sampling = None
+
+    # Per-day rollups for trend queries, updated incrementally on every run
+    cube = RollupCube("data/rollup_cube.json")
+
     # Update the JSON data with statistics
-    updated_json_data = update_json_with_statistics(json_data, analyzer)
+    updated_json_data = update_json_with_statistics(json_data, analyzer, prefilter, sampling=sampling, cube=cube,
+                                                    default_subreddit="NewZealand")
+    cube.save()
+    if prefilter:
+        summary = summarize_reports([item["prefilter"] for item in updated_json_data if "prefilter" in item])
+        print(f"Prefilter avoided {summary['inference_avoided']:.1%} of inference "
+              f"({summary['reused']} reused, skipped {summary['skipped']})")
 
     # Save the updated JSON data
     save_json(updated_json_data, output_file)
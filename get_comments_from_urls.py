@@ -4,10 +4,16 @@ import pickle
 import sys
 import os
 import uuid
+from http_cache import ResponseCache
+from metrics import increment, timed, write_jsonl
+from normalize import NORMALIZER_VERSION, normalize_comment
 
-def extract_comments(data):
+def extract_comments(data, depths=None, depth=0, timestamps=None):
     """
     Recursively extract comments from Reddit API response data.
+    If a `depths` list is given, the nesting depth of each comment (0 = top level)
+    is appended to it in the same order as the comments; likewise each comment's
+    `created_utc` for a `timestamps` list.
     """
     comments_list = []
 
@@ -15,36 +21,46 @@ def extract_comments(data):
         if comment['kind'] == 'more':
             continue
 
-        comment_body = comment['data']['body']
-        comment_body = clean_comment(comment_body)
-        comments_list.append(comment_body)
+        comments_list.append(normalize_comment(comment['data']['body']))
+        if depths is not None:
+            depths.append(depth)
+        if timestamps is not None:
+            timestamps.append(comment['data'].get('created_utc'))
 
         if 'replies' in comment['data']:
             replies = comment['data']['replies']
             if replies:
-                comments_list.extend(extract_comments(replies['data']['children']))
+                comments_list.extend(extract_comments(replies['data']['children'], depths, depth + 1, timestamps))
 
     return comments_list
 
-def clean_comment(comment):
-    """
-    Clean the comment text by removing newlines and escaping double quotes.
-    """
-    comment = comment.replace('\n', ' ').replace('\r', ' ')
-    comment = comment.replace('"', '""')
-    return comment
-
-def do_request(url):
+@timed("http.request")
+def do_request(url, cache=None, limiter=None, session=None):
     """
     Perform a request to the Reddit API to fetch comments for a given post URL.
     If a 429 error or a timeout is encountered, save progress and stop the script.
+    When a ResponseCache is given the raw response is served from / written to it.
+    When a RateLimiter is given it is waited on before going to the network and
+    told about Reddit's rate-limit headers, including the reset time after a 429.
     """
     post_url = url + '.json'
+    http = session or requests
     try:
-        response = requests.get(post_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
+        if cache:
+            response = cache.get(http, post_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10, limiter=limiter)
+        else:
+            if limiter:
+                limiter.acquire()
+            response = http.get(post_url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
         print(f"Response status code for {url}: {response.status_code}")
-        
+        increment(f"http.status.{response.status_code}")
+
+        if limiter:
+            limiter.update_from_headers(response.headers)
+
         if response.status_code == 429:
+            if limiter:
+                limiter.block_for(float(response.headers.get('X-Ratelimit-Reset', 60)))
             print("Received 429 Too Many Requests. Saving progress and stopping the script.")
             return None  # Stop fetching more data, but don't crash
 
@@ -52,17 +68,52 @@ def do_request(url):
             return response.json()
 
     except requests.exceptions.Timeout:
+        increment("http.timeouts")
         print(f"Request to {url} timed out. Saving progress and stopping.")
         return None
 
     return None
 
-def do_comments_page(data):
+@timed("extract.comments_page")
+def do_comments_page(data, depths=None, timestamps=None):
     """
     Extract comments from the Reddit API response data.
     """
-    return extract_comments(data[1]['data']['children'])
+    return extract_comments(data[1]['data']['children'], depths, timestamps=timestamps)
 
+def build_result(url, data):
+    """
+    Build the stored record for one post: its URL, subreddit, creation time,
+    and its comments with their depths and creation times.
+    Comments are normalized once here; NORMALIZER_VERSION records which version did it.
+    """
+    depths = []
+    timestamps = []
+    comments = do_comments_page(data, depths, timestamps)
+    post = data[0]['data']['children'][0]['data']
+    return {
+        "URL": url,
+        "SUBREDDIT": post.get('subreddit'),
+        "CREATED_UTC": post.get('created_utc'),
+        "COMMENTS": comments,
+        "DEPTHS": depths,
+        "TIMESTAMPS": timestamps,
+        "NORMALIZER_VERSION": NORMALIZER_VERSION
+    }
+
+def replay_from_cache(posts, cache):
+    """
+    Re-extract comments for every post straight from the response cache.
+    Posts missing from the cache are skipped; no network calls are made.
+    """
+    results = []
+    for post in posts:
+        data = do_request(post['URL'], cache=cache)
+        if data:
+            results.append(build_result(post['URL'], data))
+    return results
+
+@timed("io.save_json")
 def write_comments_to_json(data, output_directory):
     """
     Write the collected comments data to a JSON file with a random filename in the specified directory.
@@ -76,6 +127,7 @@ def write_comments_to_json(data, output_directory):
     
     print(f"Comments written to {output_path}")
 
+@timed("io.load_pkl")
 def load_from_pkl(input_filename):
     """
     Load the list of posts from a .pkl file.
@@ -83,6 +135,7 @@ def load_from_pkl(input_filename):
     with open(input_filename, 'rb') as file:
         return pickle.load(file)
 
+@timed("io.save_pkl")
 def save_to_pkl(data, output_filename):
     """
     Save the updated list of posts to a .pkl file.
@@ -105,7 +158,24 @@ if __name__ == "__main__":
     # Create the output directory if it doesn't exist
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
-    
+
+    # Raw responses are cached so re-extraction doesn't need Reddit again.
+    # Run with --offline to rebuild the comments for every post from the cache alone.
+    offline = "--offline" in sys.argv
+    cache = ResponseCache("./data/cache", offline=offline)
+
+    if offline:
+        # The replay is a complete rebuild, so it goes to its own folder (one file, replaced
+        # on every replay) instead of next to the crawl output that merge_json.py reads
+        replay_directory = "./data/NZ_replay"
+        os.makedirs(replay_directory, exist_ok=True)
+        results = replay_from_cache(posts, cache)
+        with open(os.path.join(replay_directory, "replay.json"), mode='w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=4)
+        print(f"Replayed {len(results)} posts from cache ({cache.misses} missing) into {replay_directory}.")
+        write_jsonl("metrics.jsonl", run="get_comments_from_urls --offline")
+        sys.exit(0)
+
     for post in posts:
         if post['has_downloaded'] == 1:
             print(f"Skipping already downloaded post: {post['URL']}")
@@ -113,15 +183,10 @@ if __name__ == "__main__":
 
         url = post['URL']
         print(f"Processing URL: {url}")
-        data = do_request(url)
+        data = do_request(url, cache=cache)
         
         if data:
-            comments = do_comments_page(data)
-            result = {
-                "URL": url,
-                "COMMENTS": comments
-            }
-            results.append(result)
+            results.append(build_result(url, data))
 
             # Mark as downloaded
             post['has_downloaded'] = 1
@@ -130,10 +195,12 @@ if __name__ == "__main__":
             print("Saving collected comments before stopping due to timeout or 429.")
             write_comments_to_json(results, output_directory)
             save_to_pkl(posts, pkl_file_path)  # Save using the single pkl file path variable
+            write_jsonl("metrics.jsonl", run="get_comments_from_urls")
             sys.exit(1)  # Exit script with a non-zero status
 
     # Final save
     save_to_pkl(posts, pkl_file_path)  # Save using the single pkl file path variable
     write_comments_to_json(results, output_directory)
+    write_jsonl("metrics.jsonl", run="get_comments_from_urls")
 
     print("Finished fetching and writing comments.")
@@ -1,64 +1,245 @@
 import requests
 import pickle
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from http_cache import ResponseCache
+from metrics import increment, timer, write_jsonl
 
-def get_list_of_top_posts(base_url, pages=5, time_range='all'):
+# Reddit listings return at most 100 children per page
+PAGE_SIZE = 100
+
+class RateLimiter:
+    """
+    Thread-safe limiter shared by every request made during a crawl.
+
+    Spaces requests at least `min_interval` seconds apart and, once Reddit
+    reports that the quota is exhausted (X-Ratelimit-Remaining), blocks all
+    callers until the reported reset (X-Ratelimit-Reset).
+    """
+    def __init__(self, requests_per_minute=60, clock=time.monotonic, sleep=time.sleep):
+        self.min_interval = 60.0 / requests_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until the caller is allowed to send its next request.
+        """
+        with self.lock:
+            now = self.clock()
+            slot = max(now, self.next_slot, self.blocked_until)
+            self.next_slot = slot + self.min_interval
+        if slot > now:
+            self.sleep(slot - now)
+
+    def update_from_headers(self, headers):
+        """
+        Read Reddit's rate-limit headers and block until the reset if the quota is spent.
+        """
+        remaining = headers.get('X-Ratelimit-Remaining')
+        reset = headers.get('X-Ratelimit-Reset')
+        if remaining is None or reset is None:
+            return
+        if float(remaining) < 1:
+            self.block_for(float(reset))
+
+    def block_for(self, seconds):
+        """
+        Block all callers for the given number of seconds.
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+def make_session(pool_size=10):
+    """
+    Create a requests session with a connection pool sized for the crawler workers.
+    """
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'Mozilla/5.0'})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def fetch_listing_page(http, base_url, time_range='all', after=None, limiter=None, cache=None, cache_ttl=None):
+    """
+    Fetch one page of a top listing.
+
+    :param after: Cursor returned for the previous page, or None for the first page.
+    :param cache_ttl: Optional freshness limit (seconds) overriding the cache's own TTL.
+    :return: (status code, posts on the page, cursor of the next page or None).
+    """
+    params = {'limit': PAGE_SIZE, 't': time_range}
+
+    if after:
+        params['after'] = after
+
+    with timer("http.listing"):
+        if cache:
+            response = cache.get(http, base_url, params=params, headers={'User-Agent': 'Mozilla/5.0'},
+                                 limiter=limiter, ttl=cache_ttl)
+        else:
+            if limiter:
+                limiter.acquire()
+            response = http.get(base_url, headers={'User-Agent': 'Mozilla/5.0'}, params=params, timeout=10)
+    increment(f"http.status.{response.status_code}")
+
+    if limiter:
+        limiter.update_from_headers(response.headers)
+        if response.status_code == 429:
+            limiter.block_for(float(response.headers.get('X-Ratelimit-Reset', 60)))
+
+    if response.status_code != 200:
+        print(f"Failed to retrieve data: {response.status_code}")
+        return response.status_code, [], None
+
+    data = response.json()
+    posts = []
+    for post in data['data']['children']:
+        posts.append({
+            'id': post['data']['id'],
+            'URL': f"https://old.reddit.com{post['data']['permalink']}",
+            'created_utc': post['data'].get('created_utc'),
+            'has_downloaded': 0  # Initialize to 0
+        })
+    return response.status_code, posts, data['data'].get('after')
+
+def get_list_of_top_posts(base_url, pages=5, time_range='all', session=None, limiter=None, cache=None,
+                          max_retries=3):
     """
     Function to fetch top posts from Reddit, allowing sorting by time range.
-    
+    A page rejected with 429 is retried once the limiter's block has passed;
+    if a page still fails, the pages fetched so far are returned and the
+    listing is counted as partial (crawl.listings_partial).
+
     :param base_url: Base URL of the Reddit API endpoint.
     :param pages: Number of pages to fetch (default: 5).
     :param time_range: Time range for sorting posts ('all', 'day', 'week', 'month', 'year', 'hour').
-    :return: A list of dictionaries containing 'id', 'URL', and 'has_downloaded'.
+    :param session: Optional requests session to reuse connections across calls.
+    :param limiter: Optional RateLimiter shared with other concurrent calls.
+    :param cache: Optional ResponseCache that raw listing pages are read from and written to.
+    :param max_retries: Retries per page after a 429 (needs a limiter to wait out the reset).
+    :return: A list of dictionaries containing 'id', 'URL', 'created_utc' and 'has_downloaded'.
     """
     posts = []
-    headers = {'User-Agent': 'Mozilla/5.0'}
+    http = session or requests
     after = None
-    
-    for _ in range(pages):
-        params = {'limit': 50, 't': time_range}
-        
-        if after:
-            params['after'] = after
-        
-        response = requests.get(base_url, headers=headers, params=params)
-        
-        if response.status_code != 200:
-            print(f"Failed to retrieve data: {response.status_code}")
+
+    for page_number in range(pages):
+        for _ in range(max_retries + 1):
+            # limiter.acquire() inside fetch_listing_page waits until the reset
+            status, page, next_after = fetch_listing_page(http, base_url, time_range, after, limiter, cache)
+            if status != 429 or limiter is None:
+                break
+        if status != 200:
+            increment("crawl.listings_partial")
+            print(f"Listing {base_url} ({time_range}) stopped at page {page_number + 1} of {pages}: {status}")
             break
-        
-        data = response.json()
-        
-        for post in data['data']['children']:
-            post_id = post['data']['id']
-            post_url = f"https://old.reddit.com{post['data']['permalink']}"
-            posts.append({
-                'id': post_id,
-                'URL': post_url,
-                'has_downloaded': 0  # Initialize to 0
-            })
-        
-        after = data['data'].get('after')
-        
+        posts.extend(page)
+        after = next_after
+
         if not after:
             print("No more pages to fetch.")
             break
-        
+
     return posts
 
+def crawl_listings(jobs, host='https://old.reddit.com', max_workers=8, requests_per_minute=60, store=None, cache=None):
+    """
+    Fetch many (subreddit, time_range, pages) listing jobs concurrently.
+
+    All jobs share one connection pool and one rate limiter. Posts are merged
+    into an indexed store keyed by post id, so a post that shows up in several
+    time windows (or subreddits) is kept once.
+
+    :param jobs: Iterable of (subreddit, time_range, pages) tuples.
+    :param host: Scheme and host to crawl, overridable to point at a fixture server.
+    :param max_workers: Number of jobs fetched in parallel.
+    :param requests_per_minute: Request budget shared by all workers.
+    :param store: Existing post store (dict of id -> post) to merge into.
+    :param cache: Optional ResponseCache shared by all jobs.
+    :return: The updated post store. Jobs that fail with a connection error or
+        timeout are logged and skipped; the other jobs are still merged. A job
+        cut short by an HTTP error keeps the pages it got and is counted in
+        crawl.listings_partial.
+    """
+    store = {} if store is None else store
+    jobs = list(jobs)
+    limiter = RateLimiter(requests_per_minute)
+    session = make_session(pool_size=max_workers)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for subreddit, time_range, pages in jobs:
+            base_url = f"{host}/r/{subreddit}/top.json"
+            future = executor.submit(get_list_of_top_posts, base_url, pages, time_range, session, limiter, cache)
+            futures[future] = (subreddit, time_range)
+
+        for future in as_completed(futures):
+            subreddit, time_range = futures[future]
+            try:
+                posts = future.result()
+            except requests.exceptions.RequestException as error:
+                # One failed job must not lose the pages every other job already fetched
+                increment("crawl.jobs_failed")
+                print(f"r/{subreddit} ({time_range}) failed: {error}")
+                continue
+            new_posts = 0
+            for post in posts:
+                if post['id'] in store:
+                    continue
+                post['subreddit'] = subreddit
+                store[post['id']] = post
+                new_posts += 1
+            print(f"r/{subreddit} ({time_range}): {len(posts)} posts, {new_posts} new")
+
+    session.close()
+    return store
+
+def load_post_store(filename):
+    """
+    Load a .pkl file of posts into a store indexed by post id.
+    Returns an empty store if the file does not exist yet.
+    """
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'rb') as file:
+        posts = pickle.load(file)
+    return {post['id']: post for post in posts}
+
 def save_to_pkl(data, filename="top_posts_ck.pkl"):
     """
     Save the list of posts to a .pkl file.
-    
+
     :param data: List of dictionaries containing post data.
     :param filename: Name of the .pkl file to save.
     """
     with open(filename, 'wb') as file:
         pickle.dump(data, file)
-    
+
     print(f"Data successfully saved to {filename}")
 
 if __name__ == "__main__":
-    base_url = 'https://old.reddit.com/r/NewZealand/top.json'
-    time_range = 'all'
-    top_posts = get_list_of_top_posts(base_url, pages=10, time_range=time_range)
-    save_to_pkl(top_posts, 'top_posts_NZ.pkl')
\ No newline at end of file
+    # Each subreddit keeps its own store, the file get_comments_from_urls.py reads for it
+    store_files = {'NewZealand': './data/top_posts_NZ.pkl', 'ConservativeKiwi': './data/top_posts_CK.pkl'}
+    time_ranges = ['all', 'year', 'month', 'week']
+    pages = 10
+    jobs = [(subreddit, time_range, pages) for subreddit in store_files for time_range in time_ranges]
+
+    # Merged into one store so a post is only kept once across all listings
+    store = {}
+    for subreddit, store_file in store_files.items():
+        for post_id, post in load_post_store(store_file).items():
+            post.setdefault('subreddit', subreddit)
+            store.setdefault(post_id, post)
+    cache = ResponseCache('./data/cache')  # Also creates ./data
+    store = crawl_listings(jobs, store=store, cache=cache)
+    for subreddit, store_file in store_files.items():
+        save_to_pkl([post for post in store.values() if post['subreddit'] == subreddit], store_file)
+    write_jsonl('metrics.jsonl', run='get_outgoing_links')
@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from urllib.parse import urlencode
+from metrics import increment
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class CachedResponse:
+    """
+    Minimal stand-in for requests.Response served from the on-disk cache.
+    """
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.content)
+
+class ResponseCache:
+    """
+    On-disk cache of raw HTTP response bodies, keyed by URL and query parameters.
+
+    Bodies are stored compressed (zstd when the zstandard package is installed,
+    gzip otherwise) next to a small JSON metadata file holding the ETag,
+    Last-Modified and fetch time. Entries younger than `ttl` seconds are served
+    without touching the network; older ones are revalidated with a conditional
+    request. In offline mode the network is never used and a miss is reported
+    as a 504, the status HTTP uses for an unsatisfiable only-if-cached request.
+    """
+    def __init__(self, directory, ttl=7 * 24 * 3600, offline=False, clock=time.time):
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, url, params=None):
+        """
+        Build the cache key for a URL and its query parameters.
+        """
+        if params:
+            url = f"{url}?{urlencode(sorted(params.items()))}"
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.directory, key + '.meta.json'), os.path.join(self.directory, key + '.body')
+
+    def _load(self, key):
+        """
+        Load the metadata and decompressed body of an entry, or None if it is missing.
+        """
+        meta_path, body_path = self._paths(key)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None, None
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+        with open(body_path, 'rb') as file:
+            body = file.read()
+        if meta['compression'] == 'zstd':
+            body = zstandard.ZstdDecompressor().decompress(body)
+        else:
+            body = gzip.decompress(body)
+        return meta, body
+
+    def _store(self, key, url, body, headers):
+        """
+        Compress and write an entry, replacing any previous version atomically.
+        """
+        if zstandard is not None:
+            compression = 'zstd'
+            compressed = zstandard.ZstdCompressor(level=10).compress(body)
+        else:
+            compression = 'gzip'
+            compressed = gzip.compress(body)
+
+        meta = {
+            'url': url,
+            'compression': compression,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': self.clock()
+        }
+        meta_path, body_path = self._paths(key)
+        with open(body_path + '.tmp', 'wb') as file:
+            file.write(compressed)
+        os.replace(body_path + '.tmp', body_path)
+        self._write_meta(meta_path, meta)
+
+    def iter_bodies(self):
+        """
+        Yield (url, decompressed body) for every entry in the cache, in no particular order.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith('.meta.json'):
+                meta, body = self._load(name[:-len('.meta.json')])
+                if meta is not None:
+                    yield meta['url'], body
+
+    def _write_meta(self, meta_path, meta):
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def get(self, http, url, params=None, headers=None, timeout=10, limiter=None, ttl=None):
+        """
+        Fetch a URL through the cache.
+
+        :param http: The requests module or a requests.Session used for network calls.
+        :param limiter: Optional RateLimiter acquired only when the network is actually used.
+        :param ttl: Optional freshness limit for this call, e.g. shorter for listings that change.
+        :return: A requests.Response for fresh downloads, or a CachedResponse.
+        """
+        key = self._key(url, params)
+        meta, body = self._load(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        if meta is not None and (self.offline or self.clock() - meta['fetched_at'] < ttl):
+            self.hits += 1
+            increment("cache.hits")
+            return CachedResponse(200, body)
+
+        if self.offline:
+            self.misses += 1
+            increment("cache.misses")
+            return CachedResponse(504)
+
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta['etag']:
+                request_headers['If-None-Match'] = meta['etag']
+            if meta['last_modified']:
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        if limiter:
+            limiter.acquire()
+        response = http.get(url, headers=request_headers, params=params, timeout=timeout)
+
+        if response.status_code == 304 and meta is not None:
+            self.revalidated += 1
+            increment("cache.revalidated")
+            meta['fetched_at'] = self.clock()
+            self._write_meta(self._paths(key)[0], meta)
+            return CachedResponse(200, body, response.headers)
+
+        self.misses += 1
+        increment("cache.misses")
+        if response.status_code == 200:
+            self._store(key, url, response.content, response.headers)
+        return response
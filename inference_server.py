@@ -0,0 +1,288 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from analysis import SentimentAnalyzer
+from metrics import increment, timer
+
+DEFAULT_PORT = 8765
+
+class MicroBatcher:
+    """
+    Collects comments from many concurrent requests into dynamic micro-batches.
+
+    A batch is started by the first queued comment and closed when it holds
+    `max_batch_size` comments or `max_delay` seconds have passed since that
+    first comment arrived, whichever comes first. Batches run one at a time
+    on a single worker thread that owns the analyzer.
+    """
+    def __init__(self, analyzer, max_batch_size=32, max_delay=0.01):
+        self.analyzer = analyzer
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, comment):
+        """
+        Queue one comment and return a Future for its result.
+        """
+        future = Future()
+        self.queue.put((comment, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            increment("server.batches")
+            increment("server.batched_comments", len(batch))
+            try:
+                with timer("server.batch"):
+                    results = self.analyzer.analyze_batch([comment for comment, _ in batch])
+            except Exception:
+                # Retry one by one so a single bad comment only fails its own request
+                increment("server.batch_failures")
+                self._run_individually(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run_individually(self, batch):
+        for comment, future in batch:
+            try:
+                future.set_result(self.analyzer.analyze_batch([comment])[0])
+            except Exception as error:
+                future.set_exception(error)
+
+def _to_builtin(value):
+    """
+    Convert numpy scalars in a result to plain Python values for JSON.
+    """
+    if isinstance(value, dict):
+        return {key: _to_builtin(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def make_server(batcher, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Create the HTTP server. POST /analyze with {"comments": [...]} returns {"results": [...]}.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"status": "ok", "queued": batcher.queue.qsize()})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/analyze":
+                self._reply(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                comments = json.loads(self.rfile.read(length))["comments"]
+                if not isinstance(comments, list) or not all(isinstance(comment, str) for comment in comments):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError):
+                self._reply(400, {"error": 'expected a JSON body {"comments": [<string>, ...]}'})
+                return
+            futures = [batcher.submit(comment) for comment in comments]
+            try:
+                results = [_to_builtin(future.result()) for future in futures]
+            except Exception as error:
+                self._reply(500, {"error": str(error)})
+                return
+            self._reply(200, {"results": results})
+
+    class Server(ThreadingHTTPServer):
+        # Many producers connect at once; the default backlog of 5 makes them retry
+        request_queue_size = 128
+        daemon_threads = True
+
+    return Server((host, port), Handler)
+
+class RemotePipeline:
+    """
+    Pipeline-shaped view of one model ("sentiment" or "emotion") on the server,
+    so every inherited SentimentAnalyzer method works on an InferenceClient.
+    """
+    def __init__(self, client, task):
+        self.client = client
+        self.task = task
+
+    def __call__(self, texts, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        return [
+            {"label": result[self.task][f"{self.task}_label"], "score": result[self.task][f"{self.task}_score"]}
+            for result in self.client.analyze_batch(texts)
+        ]
+
+class InferenceClient(SentimentAnalyzer):
+    """
+    Drop-in replacement for SentimentAnalyzer that sends comments to a running
+    inference server instead of loading the models in this process.
+
+    Streaming methods (analyze_iter, analyze_statistics) send `batch_size`
+    comments per request unless told otherwise, instead of one request per comment.
+    """
+    def __init__(self, url=f"http://127.0.0.1:{DEFAULT_PORT}", timeout=300, batch_size=32):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = requests.Session()
+        super().__init__(sentiment_pipeline=RemotePipeline(self, "sentiment"),
+                         emotion_pipeline=RemotePipeline(self, "emotion"))
+
+    def analyze_batch(self, comments):
+        response = self.session.post(f"{self.url}/analyze", json={"comments": list(comments)}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def analyze_comment(self, comment):
+        return self.analyze_batch([comment])[0]
+
+    def _analyze_sentiment(self, comment):
+        return self.analyze_comment(comment)["sentiment"]
+
+    def _analyze_emotion(self, comment):
+        return self.analyze_comment(comment)["emotion"]
+
+    def analyze_iter(self, comments, running=None, batch_size=None):
+        return super().analyze_iter(comments, running, batch_size or self.batch_size)
+
+    def analyze_concurrent(self, comments, executor="thread", workers=None, batch_size=None):
+        """
+        The server already runs readability and inference for its batches, so
+        this just sends the comments in batches; `executor` and `workers` are ignored.
+        """
+        comments = list(comments)
+        batch_size = batch_size or self.batch_size
+        results = []
+        for start in range(0, len(comments), batch_size):
+            results.extend(self.analyze_batch(comments[start:start + batch_size]))
+        return results
+
+    def __call__(self, comments, concurrent=False, executor="thread", workers=None):
+        # One request either way; the concurrency options only matter in-process
+        results = self.analyze_batch(comments)
+        return {
+            "individual_results": results,
+            "overall_statistics": self.summarize(results)
+        }
+
+def load_test(url, concurrency_levels=(1, 2, 4, 8, 16), requests_per_client=20, comments_per_request=8, seed=0):
+    """
+    Hit the server from N concurrent clients for each N in `concurrency_levels`.
+
+    :return: One dict per level with p50/p99 request latency (ms) and throughput (comments/sec).
+    """
+    import synthetic_corpus
+
+    report = []
+    for concurrency in concurrency_levels:
+        comments = synthetic_corpus.generate_comments(concurrency * requests_per_client * comments_per_request, seed=seed)
+        latencies = []
+        lock = threading.Lock()
+
+        def client(worker):
+            analyzer = InferenceClient(url)
+            for i in range(requests_per_client):
+                offset = (worker * requests_per_client + i) * comments_per_request
+                start = time.perf_counter()
+                analyzer.analyze_batch(comments[offset:offset + comments_per_request])
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=client, args=(worker,)) for worker in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        result = {
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "comments_per_second": len(comments) / elapsed
+        }
+        print(f"concurrency {concurrency:3d}: p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+              f"{result['comments_per_second']:.1f} comments/sec")
+        report.append(result)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared local inference server for SentimentAnalyzer.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Load the models and serve requests.")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--max-batch-size", type=int, default=32)
+    serve.add_argument("--max-delay-ms", type=float, default=10.0)
+    serve.add_argument("--stub", action="store_true", help="Use stub models (for testing the batching only).")
+
+    loadtest = subparsers.add_parser("loadtest", help="Measure latency and throughput of a running server.")
+    loadtest.add_argument("--url", default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    loadtest.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    loadtest.add_argument("--requests", type=int, default=20, help="Requests per client.")
+    loadtest.add_argument("--comments", type=int, default=8, help="Comments per request.")
+    loadtest.add_argument("--output", help="Optional JSON file for the report.")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        if args.stub:
+            import synthetic_corpus
+            analyzer = SentimentAnalyzer(synthetic_corpus.stub_sentiment_pipeline(), synthetic_corpus.stub_emotion_pipeline())
+        else:
+            analyzer = SentimentAnalyzer()
+        batcher = MicroBatcher(analyzer, args.max_batch_size, args.max_delay_ms / 1000)
+        server = make_server(batcher, port=args.port)
+        print(f"Serving on http://127.0.0.1:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        report = load_test(args.url, args.concurrency, args.requests, args.comments)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(report, file, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -29,8 +29,9 @@ def merge_json_files(input_folder, output_file):
     print(f"Merged JSON data has been saved to {output_file}")
     print(f"Number of entries in the merged JSON: {len(all_data)}")
 
-# Specify the folder containing the JSON files and the output file path
-input_folder = "./data/NZ"
-output_file = "merged_output_NZ.json"
+if __name__ == "__main__":
+    # Specify the folder containing the JSON files and the output file path
+    input_folder = "./data/NZ"
+    output_file = "merged_output_NZ.json"
 
-merge_json_files(input_folder, output_file)
+    merge_json_files(input_folder, output_file)
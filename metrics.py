@@ -0,0 +1,199 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Setting this environment variable to a file path profiles the whole run with cProfile
+PROFILE_ENV_VAR = "REDDIT_PROFILE"
+
+class Histogram:
+    """
+    Cumulative latency histogram in the Prometheus style.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+class Metrics:
+    """
+    Counters and timing histograms shared by every stage of the pipeline.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def snapshot(self, run=None):
+        """
+        Return the current metrics as a JSON-serialisable dictionary.
+        Counters are also reported as a per-second rate over the run.
+        """
+        with self.lock:
+            elapsed = time.time() - self.started
+            return {
+                "run": run,
+                "timestamp": time.time(),
+                "elapsed_seconds": elapsed,
+                "peak_rss_bytes": peak_rss_bytes(),
+                "counters": dict(self.counters),
+                "rates_per_second": {name: value / elapsed for name, value in self.counters.items()} if elapsed > 0 else {},
+                "timers": {
+                    name: {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "mean": h.sum / h.count if h.count else 0.0,
+                        "max": h.max,
+                        "buckets": dict(zip(map(str, h.buckets), h.counts))
+                    }
+                    for name, h in self.histograms.items()
+                }
+            }
+
+REGISTRY = Metrics()
+
+def _metric_name(name):
+    return "reddit_" + name.replace(".", "_").replace("-", "_")
+
+def increment(name, value=1):
+    """
+    Increase a counter in the shared registry.
+    """
+    REGISTRY.increment(name, value)
+
+@contextmanager
+def timer(name):
+    """
+    Context manager recording the wall-clock time of the block under `name`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start)
+
+def timed(name):
+    """
+    Decorator recording the wall-clock time of each call under `name`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process in bytes, or None if unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def to_prometheus(registry=REGISTRY):
+    """
+    Render the registry in the Prometheus text exposition format.
+    """
+    snapshot = registry.snapshot()
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = _metric_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+
+    with registry.lock:
+        histograms = list(registry.histograms.items())
+    for name, h in sorted(histograms):
+        metric = _metric_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, count in zip(h.buckets, h.counts):
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+        lines.append(f"{metric}_sum {h.sum}")
+        lines.append(f"{metric}_count {h.count}")
+
+    if snapshot["peak_rss_bytes"] is not None:
+        lines.append("# TYPE reddit_peak_rss_bytes gauge")
+        lines.append(f"reddit_peak_rss_bytes {snapshot['peak_rss_bytes']}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(file_path, registry=REGISTRY):
+    """
+    Write the registry to a .prom file (e.g. for the node_exporter textfile collector).
+    """
+    with open(file_path, "w") as file:
+        file.write(to_prometheus(registry))
+
+def write_jsonl(file_path, run=None, registry=REGISTRY):
+    """
+    Append a snapshot of the registry as one JSON line.
+    """
+    with open(file_path, "a") as file:
+        file.write(json.dumps(registry.snapshot(run)) + "\n")
+
+@contextmanager
+def profile_run(output_path=None):
+    """
+    Profile the enclosed block with cProfile and dump the stats to `output_path`.
+
+    With no path the REDDIT_PROFILE environment variable is used, and when that
+    is unset profiling is skipped. The dump can be read with pstats or snakeviz.
+    For sampling profiles, run the script under `py-spy record -o profile.svg --`
+    instead; nothing here needs to be enabled for that.
+    """
+    output_path = output_path or os.environ.get(PROFILE_ENV_VAR)
+    if not output_path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_path)
+        print(f"Profile written to {output_path}")
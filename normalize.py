@@ -0,0 +1,124 @@
+import html
+import json
+import re
+import sys
+import time
+
+from http_cache import ResponseCache
+
+# Bump whenever the output of normalize_comment changes, so stored data can be re-normalized
+NORMALIZER_VERSION = 2
+
+# Each branch starts with a literal character, so re can skip straight to the next
+# candidate ('\n', '[', 'h', 'w', '`', '&') instead of trying every alternative at
+# every position. Reddit's JSON bodies are markdown with &, < and > HTML-escaped,
+# hence the &gt; quotes. Line-level markup (quotes, headings, list markers) is matched
+# with the newline in front of it, so a newline is prepended to cover the first line.
+# Bare URLs never end in sentence punctuation, so "see https://x.org/a. Then" keeps its
+# full stop and textstat still counts two sentences.
+LINE_MARKUP = (
+    r"\n[ \t]*(?:>|&gt;)[^\n]*"
+    r"|\n[ \t]*(?:#{1,6}|[*+-]|\d+\.)[ \t]+"
+)
+INLINE_MARKUP = (
+    r"\[(?P<link_text>[^\]\n]*)\]\((?:[^()\s]|\([^()\s]*\))*\)"
+    r"|https?://[^\s()]*[^\s().,!?;:](?:\([^\s()]*\)(?:[^\s()]*[^\s().,!?;:])?)*"
+    r"|www\.[^\s()]*[^\s().,!?;:](?:\([^\s()]*\)(?:[^\s()]*[^\s().,!?;:])?)*"
+    r"|```.*?```"
+    r"|`(?P<code_text>[^`\n]*)`"
+    r"|&(?P<entity>#\d+|#[xX][0-9a-fA-F]+|[a-zA-Z]+);"
+)
+PATTERN = re.compile(LINE_MARKUP + "|" + INLINE_MARKUP, re.DOTALL)
+
+# For text whose newlines are already gone, where a line-anchored rule would eat
+# everything after a quote marker up to the end of the comment
+INLINE_PATTERN = re.compile(INLINE_MARKUP, re.DOTALL)
+
+# Emphasis, strikethrough and superscript markers, escape backslashes and zero-width spaces
+TRANSLATION = str.maketrans({"*": None, "~": None, "^": None, "\\": None, "\u200b": None})
+
+def _replace(match):
+    group = match.lastgroup
+    if group == "link_text" or group == "code_text":
+        return match.group(group)
+    if group == "entity":
+        return html.unescape(match.group())
+    # Quote lines, headings, list markers, URLs and code blocks
+    return " "
+
+def normalize_comment(comment, line_markup=True):
+    """
+    Turn a raw Reddit comment body into plain text for the models and textstat.
+
+    Drops quoted lines, fenced code, URLs, heading and list markers and emphasis
+    characters, keeps the text of links and inline code, decodes HTML entities and
+    collapses all whitespace (newlines included) to single spaces. The regex,
+    str.translate and split/join each run once over the text, all in C.
+
+    :param line_markup: Set to False for text that has lost its newlines; quote,
+        heading and list rules are then skipped, so no user text is dropped.
+    """
+    if line_markup:
+        text = PATTERN.sub(_replace, "\n" + comment)
+    else:
+        text = INLINE_PATTERN.sub(_replace, comment)
+    return " ".join(text.translate(TRANSLATION).split())
+
+def normalize_item(item):
+    """
+    Bring a stored post's COMMENTS up to the current NORMALIZER_VERSION in place.
+
+    Stored comments have lost their newlines (to the old clean_comment or to an
+    earlier normalizer), so only the inline rules are applied: quote lines can no
+    longer be told apart from the reply that followed them. Posts written before
+    the normalizer existed also had every double quote escaped as two; that is
+    undone first. Posts already at the current version are left untouched.
+    For a full re-normalization, re-extract from the response cache instead.
+    """
+    version = item.get("NORMALIZER_VERSION")
+    if version == NORMALIZER_VERSION:
+        return item
+    comments = item.get("COMMENTS", [])
+    if version is None:
+        comments = [comment.replace('""', '"') for comment in comments]
+    item["COMMENTS"] = [normalize_comment(comment, line_markup=False) for comment in comments]
+    item["NORMALIZER_VERSION"] = NORMALIZER_VERSION
+    return item
+
+def measure_throughput(comments, repeat=3):
+    """
+    Normalize the comments `repeat` times and return the best rate in MB/sec of input.
+    """
+    size = sum(len(comment.encode("utf-8")) for comment in comments) / 1e6
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for comment in comments:
+            normalize_comment(comment)
+        best = min(best, time.perf_counter() - start)
+    return size / best
+
+def raw_bodies(children):
+    """
+    Yield the unmodified body of every comment in a comment tree, replies included.
+    """
+    for comment in children:
+        if comment['kind'] == 'more':
+            continue
+        yield comment['data']['body']
+        replies = comment['data'].get('replies')
+        if replies:
+            yield from raw_bodies(replies['data']['children'])
+
+if __name__ == "__main__":
+    # Benchmark on the raw comment bodies in the response cache (comment pages only,
+    # listings are skipped); merged JSON output is already normalized
+    cache = ResponseCache(sys.argv[1] if len(sys.argv) > 1 else "data/cache", offline=True)
+    comments = []
+    for url, body in cache.iter_bodies():
+        data = json.loads(body)
+        if isinstance(data, list) and len(data) > 1:
+            comments.extend(raw_bodies(data[1]['data']['children']))
+    if not comments:
+        sys.exit(f"No cached comment pages in {cache.directory}")
+    print(f"Normalized {len(comments)} comments at {measure_throughput(comments):.1f} MB/sec")
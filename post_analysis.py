@@ -1,7 +1,9 @@
 import json
 from collections import defaultdict
 import numpy as np
+from metrics import timed
 
+@timed("io.load_json")
 def load_json(file_path):
     """Load JSON data from a file."""
     with open(file_path, 'r') as file:
@@ -62,6 +64,7 @@ def print_statistics(results):
             print(f"  Worst Post (Min): {values['worst_post']['url']} (Value: {values['worst_post']['value']:.4f})")
         print()  # Add a blank line between categories
 
+@timed("io.save_json")
 def save_results(results, output_file):
     """Save the results to a JSON file."""
     with open(output_file, 'w') as file:
@@ -0,0 +1,267 @@
+import hashlib
+import re
+import numpy as np
+from analysis import METRICS, metric_values
+from metrics import increment
+
+# Bodies Reddit substitutes for deleted or moderator-removed comments
+REMOVED_BODIES = {"[deleted]", "[removed]", "[ Removed by Reddit ]", "[removed by reddit]"}
+
+# Boilerplate posted by AutoModerator and other bots
+BOT_PATTERNS = [
+    r"i am a bot",
+    r"this action was performed automatically",
+    r"^\*?beep\.? boop",
+    r"please contact the moderators of this subreddit"
+]
+
+URL_ONLY = re.compile(r"^\s*(?:\[[^\]]*\]\()?<?https?://\S+?>?\)?\s*$", re.IGNORECASE)
+HAS_WORD = re.compile(r"[^\W_]", re.UNICODE)
+WORD = re.compile(r"\w+", re.UNICODE)
+
+# Modulus for the MinHash permutations; every hash is reduced below it
+MERSENNE_PRIME = (1 << 31) - 1
+
+# Parts of a per-comment result kept for reuse; the comment text itself is not stored
+SCORE_KEYS = ("sentiment", "emotion", "writing_level")
+
+class Prefilter:
+    """
+    Decide which comments actually need model inference.
+
+    Trivial comments (deleted/removed, bot boilerplate, no words at all such
+    as a lone emoji, a bare URL, or shorter than `min_words`) are skipped
+    entirely. Remaining comments are checked against a MinHash LSH index of
+    everything seen so far, across posts. A comment whose estimated Jaccard
+    similarity to an earlier one is at least `threshold` reuses that
+    representative's scores instead of being analysed again.
+
+    The index keeps a signature, a 16-byte digest of the text and the scores
+    of each representative. Once it holds `max_index_size` representatives it
+    is cleared before the next post, so memory stays bounded on any corpus;
+    duplicates that straddle a reset are simply scored again.
+    """
+    def __init__(self, skip_removed=True, skip_bots=True, skip_no_words=True, skip_urls=True,
+                 min_words=0, bot_patterns=BOT_PATTERNS, deduplicate=True, threshold=0.9,
+                 num_perm=64, bands=16, shingle_size=3, seed=1, max_index_size=100000):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.skip_removed = skip_removed
+        self.skip_bots = skip_bots
+        self.skip_no_words = skip_no_words
+        self.skip_urls = skip_urls
+        self.min_words = min_words
+        self.bot_pattern = re.compile("|".join(bot_patterns), re.IGNORECASE | re.MULTILINE)
+        self.deduplicate = deduplicate
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_index_size = max_index_size
+
+        rng = np.random.default_rng(seed)
+        self.perm_a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self.reset_index()
+
+    def reset_index(self):
+        """
+        Forget every representative seen so far.
+        """
+        # LSH state: band buckets -> representative ids, and each representative's signature
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = []
+        # Digest of the normalized text -> representative id
+        self.exact = {}
+        # Scores (SCORE_KEYS only) of each representative, filled in by analyze_with_prefilter
+        self.representative_results = []
+
+    def skip_reason(self, comment):
+        """
+        Return the name of the rule that makes a comment trivial, or None.
+        """
+        stripped = comment.strip()
+        if self.skip_removed and stripped in REMOVED_BODIES:
+            return "removed"
+        if self.skip_bots and self.bot_pattern.search(stripped):
+            return "bot"
+        if self.skip_no_words and not HAS_WORD.search(stripped):
+            return "no_words"
+        if self.skip_urls and URL_ONLY.match(stripped):
+            return "url"
+        if self.min_words and len(stripped.split()) < self.min_words:
+            return "too_short"
+        return None
+
+    def _signature(self, words):
+        """
+        MinHash signature of the word shingles of a comment.
+        """
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") % MERSENNE_PRIME
+             for s in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        # a * x + b stays below 2**63 because a, x, b are all below 2**31
+        return ((np.outer(self.perm_a, hashes) + self.perm_b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def find_or_add(self, comment):
+        """
+        Return (representative id, is_new) for a non-trivial comment.
+        """
+        words = WORD.findall(comment.lower())
+        key = hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=16).digest()
+        if key in self.exact:
+            return self.exact[key], False
+        if not self.deduplicate or not words:
+            return self._add(key, None), True
+
+        signature = self._signature(words)
+        band_keys = self._band_keys(signature)
+        candidates = set()
+        for band, band_key in enumerate(band_keys):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        for candidate in sorted(candidates):
+            if np.mean(self.signatures[candidate] == signature) >= self.threshold:
+                self.exact[key] = candidate
+                return candidate, False
+
+        representative = self._add(key, signature)
+        for band, band_key in enumerate(band_keys):
+            self.buckets[band].setdefault(band_key, []).append(representative)
+        return representative, True
+
+    def _add(self, key, signature):
+        representative = len(self.representative_results)
+        self.representative_results.append(None)
+        self.signatures.append(signature)
+        self.exact[key] = representative
+        return representative
+
+    def plan(self, comments):
+        """
+        Classify each comment as ("skip", rule), ("score", representative) or
+        ("reuse", representative).
+        The index is only reset here, between posts, so the ids stay valid for this post.
+        """
+        if len(self.representative_results) >= self.max_index_size:
+            increment("prefilter.index_resets")
+            self.reset_index()
+        actions = []
+        for comment in comments:
+            reason = self.skip_reason(comment)
+            if reason:
+                actions.append(("skip", reason))
+                continue
+            representative, is_new = self.find_or_add(comment)
+            actions.append(("score" if is_new else "reuse", representative))
+        return actions
+
+def _drift(filtered, full):
+    """
+    Absolute difference of each statistic between the prefiltered and full runs.
+    """
+    return {
+        metric: {stat: abs(float(filtered[metric][stat]) - float(full[metric][stat])) for stat in full[metric]}
+        for metric in METRICS
+    }
+
+def iter_with_prefilter(analyzer, comments, prefilter, report, running=None):
+    """
+    Lazily analyze comments, running the models only on comments the prefilter
+    keeps and has not seen before, and yield (position, result) for each kept comment.
+
+    Skipped comments are not yielded. Near-duplicates are yielded with their
+    representative's scores. If `running` (from new_running_statistics) is given
+    it is updated with every yielded result, so nothing has to be kept in memory.
+    The counts are written into `report` once the generator is exhausted.
+    """
+    actions = prefilter.plan(comments)
+    skipped = {}
+    reused = 0
+
+    for position, (comment, (action, value)) in enumerate(zip(comments, actions)):
+        if action == "skip":
+            skipped[value] = skipped.get(value, 0) + 1
+            continue
+        if action == "score":
+            result = analyzer.analyze_comment(comment)
+            prefilter.representative_results[value] = {key: result[key] for key in SCORE_KEYS}
+        else:
+            reused += 1
+        result = dict(prefilter.representative_results[value], comment=comment)
+        if running is not None:
+            for metric, metric_value in metric_values(result).items():
+                running[metric].update(metric_value)
+        yield position, result
+
+    total = len(comments)
+    scored = total - reused - sum(skipped.values())
+    increment("prefilter.skipped", sum(skipped.values()))
+    increment("prefilter.reused", reused)
+    report.update({
+        "total": total,
+        "scored": scored,
+        "reused": reused,
+        "skipped": skipped,
+        "inference_avoided": (total - scored) / total if total else 0.0
+    })
+
+def drift_from_full(analyzer, comments, overall):
+    """
+    Score every comment in full (stats-only, in constant memory) and return how
+    far each prefiltered statistic in `overall` moved from it.
+    """
+    return _drift(overall, analyzer.analyze_statistics(comments))
+
+def analyze_with_prefilter(analyzer, comments, prefilter, measure_drift=False):
+    """
+    Analyze comments with iter_with_prefilter and collect every result.
+
+    With measure_drift=True every comment is also scored in full, and the report
+    records how far the overall statistics moved. That is much slower and meant
+    for tuning the rules.
+
+    :return: (results in the SentimentAnalyzer format, report dictionary)
+    """
+    report = {}
+    results = [result for _, result in iter_with_prefilter(analyzer, comments, prefilter, report)]
+
+    overall = analyzer.summarize(results) if results else None
+    if measure_drift and results:
+        report["drift"] = _drift(overall, analyzer(comments)["overall_statistics"])
+
+    return {"individual_results": results, "overall_statistics": overall}, report
+
+def summarize_reports(reports):
+    """
+    Combine per-post prefilter reports into corpus-level totals.
+    Drift is averaged over the posts that measured it.
+    """
+    total = sum(report["total"] for report in reports)
+    scored = sum(report["scored"] for report in reports)
+    skipped = {}
+    for report in reports:
+        for rule, count in report["skipped"].items():
+            skipped[rule] = skipped.get(rule, 0) + count
+
+    summary = {
+        "total": total,
+        "scored": scored,
+        "reused": sum(report["reused"] for report in reports),
+        "skipped": skipped,
+        "inference_avoided": (total - scored) / total if total else 0.0
+    }
+    drifts = [report["drift"] for report in reports if "drift" in report]
+    if drifts:
+        summary["mean_drift"] = {
+            metric: {stat: float(np.mean([drift[metric][stat] for drift in drifts])) for stat in drifts[0][metric]}
+            for metric in METRICS
+        }
+    return summary
@@ -0,0 +1,188 @@
+import json
+import math
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from analysis import METRICS, metric_values
+
+# Width of the histogram bins used as each metric's mergeable quantile sketch
+SKETCH_BIN_WIDTHS = {
+    "sentiment": 0.01,
+    "emotion": 0.01,
+    "flesch_reading_ease": 1.0,
+    "flesch_kincaid_grade": 0.25,
+    "gunning_fog": 0.25,
+    "smog_index": 0.25,
+    "lexical_diversity": 0.01
+}
+
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+def day_bucket(created_utc):
+    """
+    UTC day ('YYYY-MM-DD') of a Reddit created_utc timestamp.
+    """
+    return datetime.fromtimestamp(created_utc, tz=timezone.utc).strftime("%Y-%m-%d")
+
+def coarsen(day, granularity):
+    """
+    Label of the bucket of the given granularity that contains `day`.
+    Weeks are labelled by their Monday.
+    """
+    if granularity == "day":
+        return day
+    if granularity == "month":
+        return day[:7]
+    if granularity == "year":
+        return day[:4]
+    if granularity == "quarter":
+        return f"{day[:4]}-Q{(int(day[5:7]) - 1) // 3 + 1}"
+    if granularity == "week":
+        value = date.fromisoformat(day)
+        return (value - timedelta(days=value.weekday())).isoformat()
+    raise ValueError(f"Unknown granularity {granularity!r}, expected one of {GRANULARITIES}")
+
+def new_cell():
+    return {"count": 0, "sum": 0.0, "sumsq": 0.0, "min": math.inf, "max": -math.inf, "sketch": {}}
+
+def merge_cells(target, cell):
+    """
+    Merge one aggregate cell into another in place. Every field is mergeable,
+    so any set of day cells can be combined into a coarser bucket.
+    """
+    target["count"] += cell["count"]
+    target["sum"] += cell["sum"]
+    target["sumsq"] += cell["sumsq"]
+    target["min"] = min(target["min"], cell["min"])
+    target["max"] = max(target["max"], cell["max"])
+    for bin_index, count in cell["sketch"].items():
+        target["sketch"][bin_index] = target["sketch"].get(bin_index, 0) + count
+    return target
+
+def describe_cell(cell, metric):
+    """
+    Turn an aggregate cell into count/mean/std/min/max/median.
+    The median is read off the sketch, so it is accurate to one bin width.
+    """
+    count = cell["count"]
+    mean = cell["sum"] / count
+    variance = max(cell["sumsq"] / count - mean * mean, 0.0)
+
+    width = SKETCH_BIN_WIDTHS[metric]
+    seen = 0
+    median = None
+    for bin_index in sorted(cell["sketch"], key=int):
+        seen += cell["sketch"][bin_index]
+        if seen * 2 >= count:
+            median = (int(bin_index) + 0.5) * width
+            break
+
+    return {
+        "count": count,
+        "mean": mean,
+        "std": math.sqrt(variance),
+        "min": cell["min"],
+        "max": cell["max"],
+        "median": median
+    }
+
+class RollupCube:
+    """
+    Pre-aggregated per-comment metrics keyed by (subreddit, UTC day, metric).
+    Subreddit names are case-insensitive, as on Reddit, and stored lowercased.
+
+    Each cell holds count, sum, sum of squares, min, max and a fixed-width
+    histogram sketch. All of these merge by addition, so trend queries at day,
+    week, month, quarter or year granularity just combine day cells. The cube
+    is updated incrementally. Posts are remembered by URL, so feeding the same
+    post twice does not double count it.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.cells = {}
+        self.ingested = set()
+        if path and os.path.exists(path):
+            with open(path, "r") as file:
+                state = json.load(file)
+            self.ingested = set(state["ingested"])
+            # Cubes saved before names were lowercased may split a subreddit over several keys
+            for subreddit, days in state["cells"].items():
+                self._merge_days(subreddit, days)
+
+    def _merge_days(self, subreddit, days):
+        target = self.cells.setdefault(subreddit.lower(), {})
+        for day, metrics in days.items():
+            target_metrics = target.setdefault(day, {})
+            for metric, cell in metrics.items():
+                if metric in target_metrics:
+                    merge_cells(target_metrics[metric], cell)
+                else:
+                    target_metrics[metric] = cell
+
+    def add(self, subreddit, created_utc, values):
+        """
+        Add one comment's {metric: value} scores to its day cell.
+        """
+        metrics = self.cells.setdefault(subreddit.lower(), {}).setdefault(day_bucket(created_utc), {})
+        for metric, value in values.items():
+            cell = metrics.get(metric)
+            if cell is None:
+                cell = metrics[metric] = new_cell()
+            cell["count"] += 1
+            cell["sum"] += value
+            cell["sumsq"] += value * value
+            cell["min"] = min(cell["min"], value)
+            cell["max"] = max(cell["max"], value)
+            bin_index = str(math.floor(value / SKETCH_BIN_WIDTHS[metric]))
+            cell["sketch"][bin_index] = cell["sketch"].get(bin_index, 0) + 1
+
+    def add_post(self, subreddit, url, timestamped_results):
+        """
+        Add a post's comments from an iterable of (created_utc, result) pairs.
+
+        The iterable is always consumed, so a generator such as
+        analyze_iter still runs, but a post already in the cube is not added again.
+        Comments without a timestamp are left out.
+        Returns True if the post was new.
+        """
+        is_new = url not in self.ingested
+        for created_utc, result in timestamped_results:
+            if is_new and created_utc is not None:
+                self.add(subreddit, created_utc, metric_values(result))
+        self.ingested.add(url)
+        return is_new
+
+    def query(self, subreddit, metric, granularity="month", start=None, end=None):
+        """
+        Trend of one metric for a subreddit, one entry per bucket in time order.
+
+        :param start: Optional first day ('YYYY-MM-DD') to include.
+        :param end: Optional last day ('YYYY-MM-DD') to include.
+        """
+        buckets = {}
+        for day, metrics in self.cells.get(subreddit.lower(), {}).items():
+            if metric not in metrics or (start and day < start) or (end and day > end):
+                continue
+            label = coarsen(day, granularity)
+            merge_cells(buckets.setdefault(label, new_cell()), metrics[metric])
+        return [dict(bucket=label, **describe_cell(buckets[label], metric)) for label in sorted(buckets)]
+
+    def save(self, path=None):
+        """
+        Atomically write the cube to JSON.
+        """
+        path = path or self.path
+        with open(path + ".tmp", "w") as file:
+            json.dump({"cells": self.cells, "ingested": sorted(self.ingested)}, file)
+        os.replace(path + ".tmp", path)
+
+if __name__ == "__main__":
+    cube = RollupCube("data/rollup_cube.json")
+    subreddit = "NewZealand"
+    for metric in METRICS:
+        start = time.perf_counter()
+        trend = cube.query(subreddit, metric, granularity="month")
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"=== r/{subreddit} {metric} by month ({elapsed:.2f} ms) ===")
+        for row in trend:
+            print(f"  {row['bucket']}: mean {row['mean']:.3f}, median {row['median']:.3f}, n={row['count']}")
@@ -1,10 +1,5 @@
 #!/bin/bash
 
-# Infinite loop to call the Python script every 10 minutes
-while true; do
-    # Call the Python script
-    python3 get_comments_from_urls.py
-
-    # Wait for 10 minutes (600 seconds)
-    sleep 600
-done
+# Run the crawl scheduler. It sleeps until Reddit's rate-limit reset on its own,
+# saves its queue on Ctrl+C / SIGTERM and resumes where it left off when restarted.
+exec python3 crawl_scheduler.py
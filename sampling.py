@@ -0,0 +1,144 @@
+from statistics import NormalDist
+import numpy as np
+from analysis import METRICS, metric_values
+from metrics import increment
+
+# Largest acceptable CI half-width of each metric's mean, in the metric's own units
+DEFAULT_TOLERANCES = {
+    "sentiment": 0.02,
+    "emotion": 0.02,
+    "flesch_reading_ease": 2.0,
+    "flesch_kincaid_grade": 0.5,
+    "gunning_fog": 0.5,
+    "smog_index": 0.5,
+    "lexical_diversity": 0.02
+}
+
+# Most multinomial weights (resamples x sample size) held at once by the bootstrap
+BOOTSTRAP_BUDGET = 1_000_000
+
+# The bootstrap re-checks the intervals only once the sample has grown by this factor
+BOOTSTRAP_GROWTH = 1.25
+
+def sampling_order(num_comments, depths=None, rng=None):
+    """
+    Order in which to score the comments of a post.
+
+    Without depths this is a random permutation. With depths the order is
+    stratified by depth: each stratum is shuffled and its members are spread
+    evenly over the sequence, so every prefix holds each depth in roughly
+    its share of the thread.
+    """
+    rng = rng or np.random.default_rng()
+    if depths is None:
+        return rng.permutation(num_comments)
+
+    depths = np.asarray(depths)
+    keys = np.empty(num_comments)
+    for depth in np.unique(depths):
+        members = rng.permutation(np.flatnonzero(depths == depth))
+        # The k-th member of a stratum of size n sits at (k + jitter) / n
+        keys[members] = (np.arange(len(members)) + rng.random()) / len(members)
+    return np.argsort(keys, kind="stable")
+
+def confidence_intervals(values, population, confidence=0.95, method="normal", resamples=1000, rng=None):
+    """
+    Confidence interval of the mean of each column of `values` (sample x metric).
+
+    "normal" uses the normal approximation with a finite population
+    correction, so the interval closes once the whole thread has been
+    scored. "bootstrap" uses percentile intervals of resampled means.
+
+    :return: Array of shape (metrics, 2) with the lower and upper bounds.
+    """
+    n = len(values)
+    means = values.mean(axis=0)
+    if n >= population:
+        return np.stack([means, means], axis=1)
+
+    if method == "bootstrap":
+        resampled = bootstrap_means(values, resamples, rng)
+        alpha = (1 - confidence) / 2
+        return np.stack([np.quantile(resampled, alpha, axis=0), np.quantile(resampled, 1 - alpha, axis=0)], axis=1)
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    correction = np.sqrt((population - n) / (population - 1))
+    half_width = z * values.std(axis=0, ddof=1) / np.sqrt(n) * correction
+    return np.stack([means - half_width, means + half_width], axis=1)
+
+def bootstrap_means(values, resamples=1000, rng=None, budget=BOOTSTRAP_BUDGET):
+    """
+    Means of `resamples` bootstrap resamples of the rows of `values` (sample x metric).
+
+    Each resample is a row of multinomial counts, so a chunk of resamples is one
+    matrix product, as in compare.py. Chunks are sized so at most `budget`
+    counts exist at once, whatever the sample size.
+
+    :return: Array of shape (resamples, metrics).
+    """
+    rng = rng or np.random.default_rng()
+    n = len(values)
+    chunk = max(1, budget // n)
+    means = []
+    for start in range(0, resamples, chunk):
+        weights = rng.multinomial(n, np.full(n, 1 / n), size=min(chunk, resamples - start))
+        means.append(weights @ values / n)
+    return np.concatenate(means)
+
+def adaptive_statistics(analyzer, comments, depths=None, tolerances=None, confidence=0.95, method="normal",
+                        min_sample=30, batch_size=20, resamples=1000, seed=0):
+    """
+    Score a random (or depth-stratified) sample of comments, growing it in
+    batches until the CI of every metric's mean is within its tolerance.
+
+    The statistics are computed over the sample. The returned dictionary
+    matches SentimentAnalyzer's output, plus a "sampling" entry with the
+    sample size and the CI of each metric.
+
+    :param depths: Optional comment depths, enabling depth-stratified order.
+    :param tolerances: Per-metric CI half-widths overriding DEFAULT_TOLERANCES.
+    :param method: "normal" or "bootstrap". The normal intervals are checked every
+        `batch_size` comments. The bootstrap is checked at sample sizes that grow by
+        BOOTSTRAP_GROWTH, so its total cost stays close to that of the last check.
+    """
+    tolerance = dict(DEFAULT_TOLERANCES, **(tolerances or {}))
+    # The normal approximation needs at least two values for a standard deviation
+    min_sample = max(min_sample, 2)
+    if depths is not None and len(depths) != len(comments):
+        depths = None
+    limits = np.array([tolerance[metric] for metric in METRICS])
+    rng = np.random.default_rng(seed)
+    order = sampling_order(len(comments), depths, rng)
+
+    results = []
+    values = np.empty((len(comments), len(METRICS)))
+    intervals = None
+    next_check = min_sample
+    for position, index in enumerate(order, start=1):
+        result = analyzer.analyze_comment(comments[index])
+        results.append(result)
+        row = metric_values(result)
+        values[position - 1] = [row[metric] for metric in METRICS]
+
+        if position < next_check and position < len(comments):
+            continue
+        next_check = position + batch_size
+        if method == "bootstrap":
+            next_check = max(next_check, int(position * BOOTSTRAP_GROWTH))
+        intervals = confidence_intervals(values[:position], len(comments), confidence, method, resamples, rng)
+        if np.all((intervals[:, 1] - intervals[:, 0]) / 2 <= limits):
+            break
+
+    increment("sampling.skipped", len(comments) - len(results))
+    return {
+        "individual_results": results,
+        "overall_statistics": analyzer.summarize(results),
+        "sampling": {
+            "sample_size": len(results),
+            "population": len(comments),
+            "method": method,
+            "confidence": confidence,
+            "stratified": depths is not None,
+            "ci": {metric: [float(low), float(high)] for metric, (low, high) in zip(METRICS, intervals)}
+        }
+    }
@@ -0,0 +1,183 @@
+import hashlib
+import random
+import time
+
+# Small vocabulary mixing short and polysyllabic words so readability scores vary
+VOCABULARY = [
+    "the", "a", "to", "and", "of", "is", "it", "that", "this", "government", "housing",
+    "people", "think", "really", "just", "country", "economy", "policy", "probably",
+    "absolutely", "ridiculous", "infrastructure", "affordable", "council", "rent", "kiwi",
+    "election", "minister", "unfortunately", "honestly", "community", "transport", "price",
+    "good", "bad", "great", "terrible", "interesting", "consideration", "responsibility",
+    "bro", "mate", "yeah", "nah", "wellington", "auckland", "christchurch", "weather", "beach"
+]
+
+EMOTION_LABELS = ["sadness", "joy", "love", "anger", "fear", "surprise"]
+
+METRIC_CATEGORIES = [
+    "sentiment", "emotion", "flesch_reading_ease", "flesch_kincaid_grade",
+    "gunning_fog", "smog_index", "lexical_diversity"
+]
+
+def generate_comment_text(rng, min_words=3, max_words=60):
+    """
+    Generate a deterministic pseudo-comment of between min_words and max_words words.
+    """
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(min_words, max_words))]
+    sentences = []
+    while words:
+        length = rng.randint(4, 15)
+        sentence, words = words[:length], words[length:]
+        sentences.append(" ".join(sentence).capitalize() + rng.choice([".", ".", "!", "?"]))
+    return " ".join(sentences)
+
+def generate_thread(num_comments=200, max_depth=6, max_words=60, more_ratio=0.05, seed=0):
+    """
+    Generate a Reddit-shaped comment page (the list returned by `<post>.json`).
+
+    Comments are attached to a random earlier comment (or the post) without
+    exceeding max_depth, and roughly `more_ratio` of the children are `more`
+    stubs, as in real API responses.
+    """
+    rng = random.Random(seed)
+    top_level = []
+    # (children list, depth) pairs a new comment can be attached to
+    parents = [(top_level, 0)]
+
+    for i in range(num_comments):
+        children, depth = rng.choice(parents)
+        if rng.random() < more_ratio:
+            children.append({"kind": "more", "data": {"count": rng.randint(1, 50), "children": []}})
+            continue
+
+        replies = []
+        comment = {
+            "kind": "t1",
+            "data": {
+                "id": f"c{seed}_{i}",
+                "author": f"user{rng.randint(0, 500)}",
+                "body": generate_comment_text(rng, max_words=max_words),
+                "created_utc": 1600000000 + rng.randint(0, 3 * 365 * 86400),
+                "replies": {"kind": "Listing", "data": {"children": replies}}
+            }
+        }
+        children.append(comment)
+        if depth + 1 < max_depth:
+            parents.append((replies, depth + 1))
+
+    _strip_empty_replies(top_level)
+    post = {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": {"id": f"p{seed}", "title": "Synthetic post"}}]}}
+    return [post, {"kind": "Listing", "data": {"children": top_level}}]
+
+def _strip_empty_replies(children):
+    """
+    Reddit sends an empty string rather than an empty listing for comments without replies.
+    """
+    for child in children:
+        if child["kind"] != "t1":
+            continue
+        replies = child["data"]["replies"]["data"]["children"]
+        if replies:
+            _strip_empty_replies(replies)
+        else:
+            child["data"]["replies"] = ""
+
+def generate_comments(num_comments=1000, max_words=60, seed=0):
+    """
+    Generate a flat list of comment strings.
+    """
+    rng = random.Random(seed)
+    return [generate_comment_text(rng, max_words=max_words) for _ in range(num_comments)]
+
+# Markdown Reddit bodies commonly contain, with the HTML escaping the JSON API applies
+MARKDOWN_DECORATIONS = [
+    lambda text, rng: f"&gt; {text[:rng.randint(10, 60)]}\n\n{text}",
+    lambda text, rng: f"{text} [source](https://www.stuff.co.nz/national/{rng.randint(1, 99999)})",
+    lambda text, rng: f"**{text}**\n\nEdit: typo &amp; formatting",
+    lambda text, rng: f"{text}\n\n* point one\n* point two &#x200B;",
+    lambda text, rng: f"{text} https://www.reddit.com/r/newzealand/comments/{rng.randint(1, 99999)}/",
+    lambda text, rng: f"# {text[:30]}\n\n{text} ~~not~~ `code`"
+]
+
+def generate_markdown_comments(num_comments=1000, markdown_ratio=0.3, max_words=60, seed=0):
+    """
+    Generate raw comment bodies where about `markdown_ratio` of them carry
+    quotes, links, URLs, emphasis, lists or HTML entities.
+    """
+    rng = random.Random(seed)
+    comments = []
+    for _ in range(num_comments):
+        text = generate_comment_text(rng, max_words=max_words)
+        if rng.random() < markdown_ratio:
+            text = rng.choice(MARKDOWN_DECORATIONS)(text, rng)
+        comments.append(text)
+    return comments
+
+def generate_posts(num_posts=50, comments_per_post=100, seed=0):
+    """
+    Generate posts in the merged JSON format ({"URL", "COMMENTS"}).
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "URL": f"https://old.reddit.com/r/synthetic/comments/{seed}_{i}/",
+            "COMMENTS": [generate_comment_text(rng) for _ in range(rng.randint(1, comments_per_post))]
+        }
+        for i in range(num_posts)
+    ]
+
+def generate_post_statistics(num_posts=500, seed=0, shift=0.0):
+    """
+    Generate posts carrying `statistics` as written by generate_stats_from_json.py.
+    `shift` offsets every value so two corpora can be told apart.
+    """
+    rng = random.Random(seed)
+    posts = []
+    for i in range(num_posts):
+        statistics = {}
+        for category in METRIC_CATEGORIES:
+            centre = rng.gauss(10.0 + shift, 3.0)
+            statistics[category] = {
+                "mean": centre,
+                "median": centre + rng.gauss(0, 0.5),
+                "std": abs(rng.gauss(2.0, 0.5))
+            }
+        posts.append({"URL": f"https://old.reddit.com/r/synthetic/comments/{seed}_{i}/", "statistics": statistics})
+    return posts
+
+class StubPipeline:
+    """
+    Deterministic stand-in for a transformers text-classification pipeline.
+
+    Labels and scores are derived from a hash of the text, so results are
+    stable across runs without loading a model. Accepts a string or a list of
+    strings, like the real pipeline. `latency` seconds per text are slept on
+    each call to mimic a forward pass, which also releases the GIL.
+    `batch_sizes` records the forward-pass size of every call: like the real
+    pipeline, a list without a batch_size keyword runs one text at a time.
+    """
+    def __init__(self, labels, latency=0.0):
+        self.labels = labels
+        self.latency = latency
+        self.calls = 0
+        self.batch_sizes = []
+
+    def _classify(self, text):
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return {"label": self.labels[value % len(self.labels)], "score": 0.5 + (value % 5000) / 10000}
+
+    def __call__(self, texts, **kwargs):
+        self.calls += 1
+        if isinstance(texts, str):
+            texts = [texts]
+        self.batch_sizes.append(min(kwargs.get("batch_size", 1), len(texts)))
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        return [self._classify(text) for text in texts]
+
+def stub_sentiment_pipeline(latency=0.0):
+    return StubPipeline(["POSITIVE", "NEGATIVE"], latency)
+
+def stub_emotion_pipeline(latency=0.0):
+    return StubPipeline(EMOTION_LABELS, latency)
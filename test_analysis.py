@@ -0,0 +1,45 @@
+import random
+import tracemalloc
+
+import synthetic_corpus
+from analysis import RunningStatistics, SentimentAnalyzer
+from benchmark import MAX_PEAK_GROWTH
+
+def stub_analyzer():
+    return SentimentAnalyzer(synthetic_corpus.stub_sentiment_pipeline(), synthetic_corpus.stub_emotion_pipeline())
+
+def comment_stream(count):
+    rng = random.Random(7)
+    return (synthetic_corpus.generate_comment_text(rng) for _ in range(count))
+
+def peak_bytes(analyzer, count):
+    tracemalloc.start()
+    try:
+        analyzer.analyze_statistics(comment_stream(count))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_analyze_statistics_peak_memory_is_flat():
+    analyzer = stub_analyzer()
+    # Below EXACT_MEDIAN_LIMIT values are buffered for an exact median, so start above it
+    size = RunningStatistics.EXACT_MEDIAN_LIMIT + 1
+    small, large = peak_bytes(analyzer, size), peak_bytes(analyzer, size * 10)
+    assert large / small <= MAX_PEAK_GROWTH
+
+def test_batches_reach_the_model_as_one_forward_pass():
+    analyzer = stub_analyzer()
+    comments = list(comment_stream(70))
+    analyzer.analyze_batch(comments[:10])
+    analyzer.analyze_concurrent(comments, batch_size=32)
+    for pipeline in (analyzer.sentiment_pipeline, analyzer.emotion_pipeline):
+        assert pipeline.batch_sizes == [10, 32, 32, 6]
+
+def test_micro_batches_reach_the_model_as_one_forward_pass():
+    from inference_server import MicroBatcher
+
+    analyzer = stub_analyzer()
+    batcher = MicroBatcher(analyzer, max_batch_size=8, max_delay=1.0)
+    futures = [batcher.submit(comment) for comment in comment_stream(16)]
+    assert len([future.result(timeout=10) for future in futures]) == 16
+    assert analyzer.sentiment_pipeline.batch_sizes == [8, 8]
@@ -0,0 +1,188 @@
+import glob
+import json
+import os
+from urllib.parse import urlsplit
+
+import requests
+
+import synthetic_corpus
+from crawl_scheduler import CrawlScheduler, FakeClock
+from get_comments_from_urls import replay_from_cache
+from get_outgoing_links import load_post_store
+from http_cache import ResponseCache
+
+HOST = "http://stub.local"
+
+class StubResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.content)
+
+class StubReddit:
+    """
+    Stand-in for a requests.Session talking to Reddit: a paged top listing of
+    `num_posts` posts and a small comment page per post. `failures` maps a
+    request key ("listing:<after>" or "comments:<id>") to a list of status codes
+    returned (or exceptions raised), in order, before the request succeeds.
+    """
+    def __init__(self, num_posts=6, page_size=2, failures=None, reset=30):
+        self.posts = [f"p{i}" for i in range(num_posts)]
+        self.page_size = page_size
+        self.failures = failures or {}
+        self.reset = reset
+        self.calls = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        path = urlsplit(url).path
+        if path.endswith("/top.json"):
+            key = f"listing:{(params or {}).get('after')}"
+        else:
+            key = f"comments:{path.split('/')[4]}"
+        self.calls.append(key)
+
+        pending = self.failures.get(key)
+        if pending:
+            status = pending.pop(0)
+            if isinstance(status, Exception):
+                raise status
+            headers = {"X-Ratelimit-Reset": str(self.reset)} if status == 429 else {}
+            return StubResponse(status, headers=headers)
+        if key.startswith("listing:"):
+            return StubResponse(200, self._listing((params or {}).get("after")))
+        return StubResponse(200, synthetic_corpus.generate_thread(num_comments=3, seed=1))
+
+    def _listing(self, after):
+        start = self.posts.index(after) + 1 if after else 0
+        page = self.posts[start:start + self.page_size]
+        children = [{"data": {"id": post_id, "permalink": f"/r/test/comments/{post_id}/title/", "created_utc": 0}}
+                    for post_id in page]
+        next_after = page[-1] if start + self.page_size < len(self.posts) else None
+        return {"data": {"children": children, "after": next_after}}
+
+    def close(self):
+        pass
+
+def make_scheduler(tmp_path, session, clock, **kwargs):
+    output = tmp_path / "out"
+    output.mkdir(exist_ok=True)
+    kwargs.setdefault("host", HOST)
+    return CrawlScheduler(str(tmp_path / "state.json"), str(tmp_path / "store.pkl"), str(output),
+                          clock=clock, session=session, **kwargs)
+
+def written_urls(tmp_path):
+    urls = []
+    for path in glob.glob(os.path.join(tmp_path, "out", "*.json")):
+        with open(path) as file:
+            urls.extend(result["URL"] for result in json.load(file))
+    return urls
+
+def test_rate_limit_sleeps_until_reset_without_using_attempts(tmp_path):
+    clock = FakeClock(start=1000.0)
+    # More 429s in a row than max_attempts allows for ordinary failures
+    session = StubReddit(failures={"listing:None": [429] * 7, "comments:p3": [429] * 7})
+    scheduler = make_scheduler(tmp_path, session, clock, max_attempts=3)
+    scheduler.add_listing("test", pages=10)
+    scheduler.run(install_signal_handlers=False)
+
+    assert clock.slept.count(30) >= 14
+    assert scheduler.pending() == 0
+    assert sorted(written_urls(tmp_path)) == sorted(f"https://old.reddit.com/r/test/comments/{p}/title/"
+                                                    for p in session.posts)
+
+def test_partial_listing_resumes_from_cursor(tmp_path):
+    clock = FakeClock()
+    session = StubReddit(num_posts=6, page_size=2, failures={"listing:p1": [500]})
+    scheduler = make_scheduler(tmp_path, session, clock, retry_delay=60)
+    scheduler.add_listing("test", pages=10)
+    scheduler.run(install_signal_handlers=False)
+
+    listing_calls = [call for call in session.calls if call.startswith("listing:")]
+    # The first page is not fetched again after the second page fails
+    assert listing_calls == ["listing:None", "listing:p1", "listing:p1", "listing:p3"]
+    assert clock.time() >= 60
+    assert len(written_urls(tmp_path)) == 6
+
+def test_retries_back_off_then_give_up(tmp_path):
+    clock = FakeClock()
+    session = StubReddit(num_posts=2, failures={"comments:p0": [500] * 10})
+    scheduler = make_scheduler(tmp_path, session, clock, retry_delay=60, max_attempts=3)
+    scheduler.add_listing("test", pages=10)
+    scheduler.run(install_signal_handlers=False)
+
+    assert session.calls.count("comments:p0") == 3
+    # Backed off 60s after the first failure and 120s after the second
+    assert clock.time() >= 180
+    assert written_urls(tmp_path) == ["https://old.reddit.com/r/test/comments/p1/title/"]
+
+def test_resume_from_state_file_after_crash(tmp_path):
+    clock = FakeClock()
+    session = StubReddit(num_posts=4)
+    first = make_scheduler(tmp_path, session, clock)
+    first.add_listing("test", pages=10)
+    # Listing pages, then two comment pages that are never flushed: a crash, not a clean stop
+    while session.calls.count("listing:p1") == 0 or len([c for c in session.calls if c.startswith("comments")]) < 2:
+        first.step()
+
+    second = make_scheduler(tmp_path, session, clock)
+    assert second.pending() > 0
+    second.run(install_signal_handlers=False)
+
+    urls = written_urls(tmp_path)
+    assert sorted(urls) == sorted(set(urls))
+    assert len(urls) == 4
+
+def test_listing_recheck_is_not_served_from_stale_cache(tmp_path):
+    clock = FakeClock()
+    session = StubReddit(num_posts=1)
+    cache = ResponseCache(str(tmp_path / "cache"), clock=clock.time)
+    scheduler = make_scheduler(tmp_path, session, clock, cache=cache, listing_ttl=600)
+    scheduler.add_listing("test", "day", pages=1, interval=3600)
+    while clock.time() < 2 * 3600 + 1:
+        scheduler.step()
+
+    assert session.calls.count("listing:None") == 3
+
+def test_listing_save_does_not_mark_unwritten_posts_downloaded(tmp_path):
+    clock = FakeClock()
+    session = StubReddit(num_posts=4, failures={"listing:p1": [500]})
+    first = make_scheduler(tmp_path, session, clock, retry_delay=60)
+    first.add_listing("test", pages=10)
+    # p0/p1 listed and their comments fetched but not flushed, then the retried page adds p2/p3
+    while session.calls.count("listing:p1") < 2:
+        first.step()
+
+    second = make_scheduler(tmp_path, session, clock)
+    second.run(install_signal_handlers=False)
+
+    assert sorted(written_urls(tmp_path)) == sorted(f"https://old.reddit.com/r/test/comments/{p}/title/"
+                                                    for p in session.posts)
+
+def test_connection_errors_are_retried_and_results_kept(tmp_path):
+    clock = FakeClock()
+    session = StubReddit(num_posts=2, failures={
+        "listing:None": [requests.exceptions.ConnectTimeout("connect timed out")],
+        "comments:p1": [requests.exceptions.ConnectionError("connection reset")] * 10
+    })
+    scheduler = make_scheduler(tmp_path, session, clock, retry_delay=60, max_attempts=2)
+    scheduler.add_listing("test", pages=10)
+    scheduler.run(install_signal_handlers=False)
+
+    assert session.calls.count("listing:None") == 2
+    assert session.calls.count("comments:p1") == 2
+    assert written_urls(tmp_path) == ["https://old.reddit.com/r/test/comments/p0/title/"]
+
+def test_offline_replay_reads_what_the_scheduler_cached(tmp_path):
+    session = StubReddit(num_posts=3)
+    scheduler = make_scheduler(tmp_path, session, FakeClock(), host="https://old.reddit.com",
+                               cache=ResponseCache(str(tmp_path / "cache")))
+    scheduler.add_listing("test", pages=10)
+    scheduler.run(install_signal_handlers=False)
+
+    cache = ResponseCache(str(tmp_path / "cache"), offline=True)
+    results = replay_from_cache(load_post_store(str(tmp_path / "store.pkl")).values(), cache)
+    assert len(results) == 3
+    assert cache.misses == 0